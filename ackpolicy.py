@@ -0,0 +1,75 @@
+# #################################################################################################################### #
+# Ack Policy                                                                                                           #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Pluggable receiver policies that decide when received data is acknowledged. An RDTLayer asks its policy about every  #
+# data segment it receives and, once per iteration, whether a held-back ack is due.                                    #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# Time is in the layer's timer clock, RDTLayer iterations by default.                                                  #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+class AckPolicy(object):
+    coalesce = False        # Send at most one of identical acks owed in one iteration, see RDTLayer.oweAck()
+
+    # A data segment arrived. inOrder is False for a gap, a duplicate, a corrupted segment or one that filled a gap.
+    # Returns True when it must be acked now
+    def onData(self, inOrder, now):
+        return True
+
+    # An ack went out, alone or piggybacked
+    def onAckSent(self):
+        pass
+
+    # When the held-back ack must go out, or None when nothing is held back
+    def deadline(self):
+        return None
+
+
+# #################################################################################################################### #
+# AckEverySegment                                                                                                      #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# One ack per received data segment, the original behaviour.                                                           #
+# #################################################################################################################### #
+class AckEverySegment(AckPolicy):
+    pass
+
+
+# #################################################################################################################### #
+# DelayedAck                                                                                                           #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Acks every `every` in-order segments, or `delay` after the first one left unacked. Anything not in order is acked    #
+# at once so the sender still sees duplicate acks for fast retransmit, and identical acks in one iteration are         #
+# coalesced into the latest while no gap is open (RFC 1122 4.2.3.2, RFC 5681 4.2). Keep `delay` below the sender's     #
+# minimum RTO, or a held-back ack can arrive after the segment already timed out.                                      #
+# #################################################################################################################### #
+class DelayedAck(AckPolicy):
+    coalesce = True
+
+    def __init__(self, every=2, delay=1):
+        self.every = every
+        self.delay = delay
+        self.unacked = 0            # In-order segments received since the last ack
+        self.since = None           # When the oldest of them arrived
+
+    def onData(self, inOrder, now):
+        if not inOrder:
+            return True
+        self.unacked += 1
+        if self.since is None:
+            self.since = now
+        return self.unacked >= self.every
+
+    def onAckSent(self):
+        self.unacked = 0
+        self.since = None
+
+    def deadline(self):
+        if self.since is None:
+            return None
+        return self.since + self.delay
@@ -0,0 +1,274 @@
+from rdt_layer import RDTLayer, DATA_LENGTH
+from fastchannel import FastUnreliableChannel
+import fastchannel
+from unreliable import UnreliableChannel
+from congestion import WestwoodCongestionControl
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import csv
+import hashlib
+import itertools
+import json
+import random
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# #################################################################################################################### #
+# Benchmark                                                                                                            #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Reproducible lock-step transfers over a grid of payload sizes, segment sizes, receive windows and channel ratios.    #
+# Every trial generates its payload and seeds its channels, corruption included, from its own seed, so a trial's       #
+# iterations and packet counts are the same on every run and every machine; wall time, goodput and memory are measured #
+# too but vary from run to run.                                                                                        #
+#                                                                                                                      #
+# A baseline holds each trial's metrics under its key. compareBaseline() lists every trial that got worse than its     #
+# baseline by more than the metric's tolerance, or that no longer completes. By default only the reproducible metrics  #
+# in REGRESSION_TOLERANCE are recorded, which is what bench_baseline.json holds; add MACHINE_TOLERANCE's for a         #
+# baseline that is only compared on the machine that recorded it.                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# Each trial runs in a fresh worker process, so its peak RSS is its own. The 'fast' channel draws from NumPy when it   #
+# is installed and from the random module otherwise, unless the grid names one. They are different streams, so the     #
+# generator is part of the trial's key. The 'classic' channel is unreliable.py's, seeded through the global random     #
+# state.                                                                                                               #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+MAX_ITERATIONS = 1000000    # iterations after which a trial is given up as stuck
+
+# Metrics a baseline records and (relative, absolute) slack before a trial counts as a regression
+REGRESSION_TOLERANCE = {
+    'iterations': (0.05, 1),
+    'retransmissionRatio': (0.10, 0.005),
+}
+
+# Metrics that depend on the machine, only worth comparing against a baseline recorded on the same one
+MACHINE_TOLERANCE = {
+    'seconds': (0.50, 0.05),
+    'peakMemory': (0.25, 4 * 1024 * 1024),
+}
+
+RESULT_FIELDS = ['key', 'size', 'mss', 'window', 'drop', 'delay', 'error', 'reorder', 'seed', 'channel', 'generator',
+                 'ok', 'iterations', 'seconds', 'goodput', 'bytesPerIteration', 'retransmissionRatio', 'dataPackets',
+                 'retransmissions', 'ackPackets', 'timeouts', 'fastRetransmits', 'peakMemory']
+
+
+# #################################################################################################################### #
+# makeGrid()                                                                                                           #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# One trial, a dict of plain values, for every combination of the given lists. generator is the fast channel's,        #
+# 'numpy' or 'random', None for NumPy when it is installed                                                             #
+# #################################################################################################################### #
+def makeGrid(sizes, segmentSizes, windows, drops, delays, errors, reorders, seeds, channel='fast',
+             maxIterations=MAX_ITERATIONS, generator=None):
+    if channel == 'classic':
+        if generator == 'numpy':
+            raise ValueError("the classic channel only draws from the random module")
+        generator = 'random'
+    elif generator is None:
+        generator = 'numpy' if fastchannel.numpy is not None else 'random'
+    trials = []
+    for size, mss, window, drop, delay, error, reorder, seed in itertools.product(
+            sizes, segmentSizes, windows, drops, delays, errors, reorders, seeds):
+        trials.append({'size': size, 'mss': mss, 'window': window, 'drop': drop, 'delay': delay, 'error': error,
+                       'reorder': reorder, 'seed': seed, 'channel': channel, 'generator': generator,
+                       'maxIterations': maxIterations})
+    return trials
+
+
+def trialKey(trial):
+    return "size={size} mss={mss} window={window} drop={drop} delay={delay} error={error} reorder={reorder} " \
+           "seed={seed} channel={channel} generator={generator}".format(**trial)
+
+
+class DigestSink(object):
+    def __init__(self):
+        self.digest = hashlib.sha256()
+
+    def __call__(self, data):
+        self.digest.update(data)
+
+
+# Overrides the ratios of one channel, or of every classic channel while the trial runs
+@contextlib.contextmanager
+def channelRatios(target, trial):
+    names = {'RATIO_DROPPED_PACKETS': trial['drop'], 'RATIO_DELAYED_PACKETS': trial['delay'],
+             'RATIO_DATA_ERROR_PACKETS': trial['error'], 'RATIO_OUT_OF_ORDER_PACKETS': trial['reorder']}
+    saved = dict((name, getattr(target, name)) for name in names)
+    for name, value in names.items():
+        setattr(target, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(target, name, value)
+
+
+def makeChannels(trial, rng):
+    if trial['channel'] == 'classic':
+        random.seed(rng.randrange(2 ** 32))
+        return UnreliableChannel(True, True, True, True), UnreliableChannel(True, True, True, True)
+    return (FastUnreliableChannel(True, True, True, True, seed=rng.randrange(2 ** 32), generator=trial['generator']),
+            FastUnreliableChannel(True, True, True, True, seed=rng.randrange(2 ** 32), generator=trial['generator']))
+
+
+def peakMemory():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+# #################################################################################################################### #
+# runTrial()                                                                                                           #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Worker. Sends the trial's payload from a client to a server layer, lock-step like rdt_main.py, checks what arrived   #
+# against it and returns the trial with its metrics. ok is False when it didn't complete within maxIterations or the   #
+# data arrived wrong                                                                                                   #
+# #################################################################################################################### #
+def runTrial(trial):
+    rng = random.Random(trial['seed'])
+    data = rng.randbytes(trial['size'])
+    expected = hashlib.sha256(data).digest()
+    clientToServerChannel, serverToClientChannel = makeChannels(trial, rng)
+
+    client = RDTLayer()
+    server = RDTLayer()
+    for layer in (client, server):
+        layer.setSelectiveAck(True)
+        layer.setSegmentSize(trial['mss'])
+        layer.setReceiveBuffer(trial['window'])
+    client.setSendChannel(clientToServerChannel)
+    client.setReceiveChannel(serverToClientChannel)
+    server.setSendChannel(serverToClientChannel)
+    server.setReceiveChannel(clientToServerChannel)
+    client.setCongestionControl(WestwoodCongestionControl(DATA_LENGTH))
+    client.setDataSource([data])
+    sink = DigestSink()
+    server.setDataSink(sink)
+    del data
+
+    if trial['channel'] == 'classic':
+        ratios = channelRatios(UnreliableChannel, trial)
+    else:
+        ratios = contextlib.ExitStack()
+        for channel in (clientToServerChannel, serverToClientChannel):
+            ratios.enter_context(channelRatios(channel, trial))
+
+    size = trial['size']
+    loopIter = 0
+    start = time.perf_counter()
+    with ratios:
+        while (server.bytesDelivered() < size or not client.isSendComplete()) and loopIter < trial['maxIterations']:
+            loopIter += 1
+            client.processData()
+            clientToServerChannel.processData()
+            server.processData()
+            serverToClientChannel.processData()
+    elapsed = time.perf_counter() - start
+
+    dataPackets = clientToServerChannel.countTotalDataPackets
+    result = dict(trial)
+    result.update({
+        'key': trialKey(trial),
+        'ok': server.bytesDelivered() == size and sink.digest.digest() == expected,
+        'iterations': loopIter,
+        'seconds': elapsed,
+        'goodput': server.bytesDelivered() / elapsed if elapsed else 0.0,
+        'bytesPerIteration': server.bytesDelivered() / loopIter if loopIter else 0.0,
+        'retransmissionRatio': client.countRetransmissions / dataPackets if dataPackets else 0.0,
+        'dataPackets': dataPackets,
+        'retransmissions': client.countRetransmissions,
+        'ackPackets': serverToClientChannel.countAckPackets,
+        'timeouts': client.countSegmentTimeouts,
+        'fastRetransmits': client.countFastRetransmits,
+        'peakMemory': peakMemory(),
+    })
+    return result
+
+
+# #################################################################################################################### #
+# runBenchmarks()                                                                                                      #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Runs the trials on a pool of `workers` processes (os.cpu_count() by default), one process per trial, and returns     #
+# their results in the trials' order. progress, when given, is called with each result as it comes in                  #
+# #################################################################################################################### #
+def runBenchmarks(trials, workers=None, progress=None):
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=1) as pool:
+        for result in pool.map(runTrial, trials):
+            if progress is not None:
+                progress(result)
+            results.append(result)
+    return results
+
+
+def writeJson(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def writeCsv(results, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, RESULT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(results)
+
+
+# A baseline is {trial key: {metric: value}} for the metrics in tolerance
+def saveBaseline(results, path, tolerance=REGRESSION_TOLERANCE):
+    baseline = dict((result['key'], dict((name, result[name]) for name in tolerance))
+                    for result in results if result['ok'])
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+
+def loadBaseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+# #################################################################################################################### #
+# compareBaseline()                                                                                                    #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Returns a line for every regression: a trial the baseline has that failed or wasn't run, or a metric worse than its  #
+# baseline value by more than its tolerance. A baseline trial missing from the results is usually a different sweep    #
+# or generator, and would otherwise pass unchecked. Trials and metrics the baseline doesn't have are not compared. A   #
+# retransmission ratio moves in steps of one packet, so a short trial is allowed at least one retransmission more than #
+# its baseline                                                                                                         #
+# #################################################################################################################### #
+def compareBaseline(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    regressions = []
+    run = set(result['key'] for result in results)
+    for key in sorted(baseline):
+        if key not in run:
+            regressions.append("{0}: not run".format(key))
+    for result in results:
+        expected = baseline.get(result['key'])
+        if expected is None:
+            continue
+        if not result['ok']:
+            regressions.append("{0}: did not complete".format(result['key']))
+            continue
+        for name, (relative, absolute) in tolerance.items():
+            value = result.get(name)
+            base = expected.get(name)
+            if value is None or base is None:
+                continue
+            if name == 'retransmissionRatio' and result['dataPackets']:
+                absolute = max(absolute, 1 / result['dataPackets'])
+            if value > base * (1 + relative) + absolute:
+                regressions.append("{0}: {1} {2:.6g} > baseline {3:.6g}".format(result['key'], name, value, base))
+    return regressions
@@ -0,0 +1,203 @@
+# #################################################################################################################### #
+# Congestion Control                                                                                                   #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Pluggable engines that size the sender's window from acks, duplicate acks and losses. Windows are kept in            #
+# characters, like FLOW_CONTROL_WIN_SIZE, and an RDTLayer keeps at most getWindow() unacknowledged and unsacked.       #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# Time is measured in RDTLayer iterations.                                                                             #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+MAX_WINDOW = 65535          # Window bound until the peer's receive buffer is known, in characters
+
+
+class CongestionControl(object):
+    def __init__(self, mss, maxWindow=MAX_WINDOW):
+        self.mss = mss
+        self.maxWindow = maxWindow
+        self.cwnd = mss
+
+    # Window the sender may use, in characters
+    def getWindow(self):
+        return max(self.mss, min(self.cwnd, self.maxWindow))
+
+    # The handshake settled on a segment size. The window keeps its size in segments
+    def setMss(self, mss):
+        self.cwnd = self.cwnd * mss / self.mss
+        self.mss = mss
+
+    # The handshake gave the peer's receive buffer. No more than it holds can be in flight, so it bounds the window
+    def setReceiverWindow(self, window):
+        self.maxWindow = window
+
+    # New data was cumulatively acknowledged
+    def onAck(self, ackedChars, iteration):
+        pass
+
+    # The same cumulative ack arrived again; count is the number of duplicates so far
+    def onDupAck(self, count, iteration):
+        pass
+
+    # A segment was declared lost by its retransmission timer
+    def onTimeout(self, iteration):
+        pass
+
+    # Everything in flight when a round trip began is acked; delivered is what was acked or sacked meanwhile
+    def onRoundTrip(self, delivered):
+        pass
+
+
+# #################################################################################################################### #
+# FixedWindow                                                                                                          #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Constant window, the original FLOW_CONTROL_WIN_SIZE pipeline.                                                        #
+# #################################################################################################################### #
+class FixedWindow(CongestionControl):
+    def __init__(self, mss, window):
+        super().__init__(mss, window)
+        self.cwnd = window
+
+    def setMss(self, mss):
+        self.maxWindow = self.maxWindow * mss / self.mss
+        super().setMss(mss)
+
+    # The window is the one asked for, the peer's advertised window still limits what is sent
+    def setReceiverWindow(self, window):
+        pass
+
+
+# #################################################################################################################### #
+# RenoCongestionControl                                                                                                #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Slow start up to ssthresh, then additive increase of one mss per window. Three duplicate acks halve the window and   #
+# enter fast recovery, where each further duplicate inflates it by one mss until new data is acked. A timeout drops    #
+# back to one mss and slow start (RFC 5681).                                                                           #
+# #################################################################################################################### #
+class RenoCongestionControl(CongestionControl):
+    INITIAL_WINDOW_SEGMENTS = 3
+    DUP_ACK_THRESHOLD = 3
+
+    def __init__(self, mss, maxWindow=MAX_WINDOW):
+        super().__init__(mss, maxWindow)
+        self.cwnd = RenoCongestionControl.INITIAL_WINDOW_SEGMENTS * mss
+        self.ssthresh = maxWindow
+        self.inRecovery = False
+
+    # Before any loss, slow start runs up to the new bound
+    def setReceiverWindow(self, window):
+        if self.ssthresh == self.maxWindow:
+            self.ssthresh = window
+        super().setReceiverWindow(window)
+
+    def onAck(self, ackedChars, iteration):
+        if self.inRecovery:
+            # Deflate the window once the hole is filled
+            self.inRecovery = False
+            self.cwnd = self.ssthresh
+            return
+        if self.cwnd < self.ssthresh:
+            # Appropriate byte counting, at most two segments per ack
+            self.cwnd += min(ackedChars, 2 * self.mss)
+        else:
+            self.congestionAvoidance(ackedChars, iteration)
+        self.cwnd = min(self.cwnd, self.maxWindow)
+
+    def congestionAvoidance(self, ackedChars, iteration):
+        self.cwnd += self.mss * ackedChars / self.cwnd
+
+    def onDupAck(self, count, iteration):
+        if count == RenoCongestionControl.DUP_ACK_THRESHOLD and not self.inRecovery:
+            self.reduce(iteration)
+            self.cwnd = self.ssthresh + RenoCongestionControl.DUP_ACK_THRESHOLD * self.mss
+            self.inRecovery = True
+        elif self.inRecovery:
+            self.cwnd = min(self.cwnd + self.mss, self.maxWindow)
+
+    def onTimeout(self, iteration):
+        self.reduce(iteration)
+        self.cwnd = self.mss
+        self.inRecovery = False
+
+    # Multiplicative decrease of ssthresh on a loss
+    def reduce(self, iteration):
+        self.ssthresh = max(self.cwnd / 2, 2 * self.mss)
+
+
+# #################################################################################################################### #
+# CubicCongestionControl                                                                                               #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Reno's slow start and fast recovery, but congestion avoidance follows W(t) = C(t - K)^3 + Wmax around the window at  #
+# the last loss, and losses only back off to BETA of the window (RFC 8312). Wmax and C are in segments.                #
+# #################################################################################################################### #
+class CubicCongestionControl(RenoCongestionControl):
+    C = 0.4
+    BETA = 0.7
+
+    def __init__(self, mss, maxWindow=MAX_WINDOW):
+        super().__init__(mss, maxWindow)
+        self.wMax = 0
+        self.k = 0
+        self.epochStart = None
+
+    def congestionAvoidance(self, ackedChars, iteration):
+        if self.epochStart is None:
+            self.epochStart = iteration
+            segments = self.cwnd / self.mss
+            if segments < self.wMax:
+                self.k = ((self.wMax - segments) / CubicCongestionControl.C) ** (1 / 3)
+            else:
+                self.k = 0
+                self.wMax = segments
+        t = iteration - self.epochStart
+        target = CubicCongestionControl.C * (t - self.k) ** 3 + self.wMax
+        segments = self.cwnd / self.mss
+        if target > segments:
+            self.cwnd += self.mss * (target - segments) / segments * ackedChars / self.mss
+        else:
+            self.cwnd += 0.01 * self.mss * ackedChars / self.cwnd
+
+    def reduce(self, iteration):
+        segments = self.cwnd / self.mss
+        # Fast convergence: release bandwidth sooner when the window keeps shrinking
+        if segments < self.wMax:
+            self.wMax = segments * (1 + CubicCongestionControl.BETA) / 2
+        else:
+            self.wMax = segments
+        self.epochStart = None
+        self.ssthresh = max(self.cwnd * CubicCongestionControl.BETA, 2 * self.mss)
+
+
+# #################################################################################################################### #
+# WestwoodCongestionControl                                                                                            #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Reno, but a loss sets ssthresh to the data the path delivered per round trip instead of half the window (Westwood+). #
+# Random loss on the channel then costs the retransmission, not the rate: Reno's halving on every drop holds the       #
+# window to a few segments at the channels' loss ratios. The estimate follows the samples with ALPHA, which is below   #
+# Westwood+'s 0.9 because losses come every few round trips here, not every few hundred.                               #
+# #################################################################################################################### #
+class WestwoodCongestionControl(RenoCongestionControl):
+    ALPHA = 0.5
+
+    def __init__(self, mss, maxWindow=MAX_WINDOW):
+        super().__init__(mss, maxWindow)
+        self.bwe = None
+
+    def onRoundTrip(self, delivered):
+        if self.bwe is None:
+            self.bwe = delivered
+        else:
+            self.bwe = WestwoodCongestionControl.ALPHA * self.bwe + (1 - WestwoodCongestionControl.ALPHA) * delivered
+
+    # Back off to what got through, Reno's halving until a round trip has been measured
+    def reduce(self, iteration):
+        if self.bwe is None:
+            super().reduce(iteration)
+        else:
+            self.ssthresh = max(self.bwe, 2 * self.mss)
@@ -0,0 +1,271 @@
+import asyncio
+import random
+
+from rdt_layer import RDTLayer, DATA_LENGTH
+from congestion import WestwoodCongestionControl
+from rtt import RttEstimator
+from source import AppendSource
+
+
+# #################################################################################################################### #
+# Asyncio runtime                                                                                                      #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Runs RDTLayer endpoints as asyncio tasks instead of from a lock-step main loop. Each Connection's task calls         #
+# processData() only when a segment arrives for it, the application gives it data, or its earliest retransmission      #
+# timer expires, and otherwise sleeps, so an idle connection costs nothing and one event loop can run many transfers.  #
+#                                                                                                                      #
+#   sender, receiver = openConnectionPair()                                                                            #
+#   await sender.send(b'...')           await receiver.recv()                                                          #
+#   await sender.close()                                                                                               #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# Both ends may send() and recv() at once, acks ride on the data going the other way. Timers run on the loop's clock,  #
+# in seconds. A closed connection that received data lingers, TIME_WAIT style, answering the peer's retransmissions    #
+# until no data has arrived for LINGER_RTOS of the largest RTO, in case its last ack was lost: the peer's backed-off   #
+# timer never waits longer than that between retransmissions.                                                          #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+SEND_BUFFER_SIZE = 65536    # Unacknowledged bytes send() lets pile up before it waits
+MAX_BURST = 32              # Segments the sender sends per iteration, the receiver drains one burst while it sends more
+LINGER_RTOS = 2             # maxRtos without data from the peer before a closed connection stops
+
+
+# #################################################################################################################### #
+# AsyncChannel                                                                                                         #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# One direction of an in-process link. processData(), called by the sending task, applies UnreliableChannel's          #
+# drop/delay/corrupt/reorder emulation and hands the rest to the receiving side after `latency` seconds (delayed       #
+# segments after DELAY more), then wakes the receiving task.                                                           #
+# #################################################################################################################### #
+class AsyncChannel(object):
+    RATIO_DROPPED_PACKETS = 0.1
+    RATIO_DELAYED_PACKETS = 0.1
+    RATIO_DATA_ERROR_PACKETS = 0.1
+    RATIO_OUT_OF_ORDER_PACKETS = 0.1
+    DELAY = 0.005               # seconds a delayed segment is held back
+
+    def __init__(self, canDeliverOutOfOrder_=False, canDropPackets_=False, canDelayPackets_=False,
+                 canHaveChecksumErrors_=False, latency=0.0, seed=None):
+        self.sendQueue = []
+        self.receiveQueue = []
+        self.canDeliverOutOfOrder = canDeliverOutOfOrder_
+        self.canDropPackets = canDropPackets_
+        self.canDelayPackets = canDelayPackets_
+        self.canHaveChecksumErrors = canHaveChecksumErrors_
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self.wakeup = None              # Called whenever segments are added to receiveQueue
+        # stats
+        self.countTotalDataPackets = 0
+        self.countSentPackets = 0
+        self.countChecksumErrorPackets = 0
+        self.countDroppedPackets = 0
+        self.countDelayedPackets = 0
+        self.countOutOfOrderPackets = 0
+        self.countAckPackets = 0
+
+    def setWakeup(self, wakeup):
+        self.wakeup = wakeup
+
+    def send(self,seg):
+        self.sendQueue.append(seg)
+
+    def receive(self):
+        new_list = self.receiveQueue
+        self.receiveQueue = []
+        return new_list
+
+    def processData(self):
+        if len(self.sendQueue) == 0:
+            return
+        batch = self.sendQueue
+        self.sendQueue = []
+
+        if self.canDeliverOutOfOrder and self.rng.random() <= self.RATIO_OUT_OF_ORDER_PACKETS:
+            self.countOutOfOrderPackets += 1
+            batch.reverse()
+
+        r = self.rng.random
+        now = []
+        later = []
+        for seg in batch:
+            if seg.seqnum != -1:
+                self.countTotalDataPackets += 1
+                # only data packets can have checksum errors...
+                if self.canHaveChecksumErrors and r() <= self.RATIO_DATA_ERROR_PACKETS:
+                    seg.createChecksumError(self.rng)
+                    self.countChecksumErrorPackets += 1
+            else:
+                # count ack packets...
+                self.countAckPackets += 1
+
+            if self.canDropPackets and r() <= self.RATIO_DROPPED_PACKETS:
+                self.countDroppedPackets += 1
+            elif self.canDelayPackets and r() <= self.RATIO_DELAYED_PACKETS:
+                self.countDelayedPackets += 1
+                later.append(seg)
+            else:
+                now.append(seg)
+
+        loop = asyncio.get_running_loop()
+        if self.latency:
+            loop.call_later(self.latency, self.arrive, now)
+        else:
+            self.arrive(now)
+        if later:
+            loop.call_later(self.latency + self.DELAY, self.arrive, later)
+
+    def arrive(self, segments):
+        if not segments:
+            return
+        self.receiveQueue.extend(segments)
+        self.countSentPackets += len(segments)
+        if self.wakeup is not None:
+            self.wakeup()
+
+
+# #################################################################################################################### #
+# Connection                                                                                                           #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# One RDTLayer endpoint and the task that drives it. Create it inside a running event loop, with the channel it sends  #
+# on and the channel it receives from                                                                                  #
+# #################################################################################################################### #
+class Connection(object):
+    def __init__(self, layer, sendChannel, receiveChannel):
+        self.layer = layer
+        self.sendChannel = sendChannel
+        self.receiveChannel = receiveChannel
+        layer.setSendChannel(sendChannel)
+        layer.setReceiveChannel(receiveChannel)
+        self.source = None
+        self.delivered = layer.deliveries()
+        self.closed = False
+        self.heard = None               # Loop time data last arrived, None until some does
+        self.wakeup = asyncio.Event()
+        self.progress = asyncio.Condition()
+
+        loop = asyncio.get_running_loop()
+        if hasattr(receiveChannel, 'fileno'):
+            # A socket channel: read it when the loop sees a datagram
+            loop.add_reader(receiveChannel.fileno(), self.wakeup.set)
+        else:
+            receiveChannel.setWakeup(self.wakeup.set)
+        self.task = loop.create_task(self.run())
+
+    # ################################################################################################################ #
+    # run()                                                                                                            #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # The connection's task. Processes, then sleeps until woken or until the earliest retransmission timer expires.    #
+    # After close() it keeps going until the linger deadline passes without data arriving                              #
+    # ################################################################################################################ #
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self.wakeup.clear()
+            # Only data needs acking, acks the peer sends after close() don't keep it lingering
+            if any(seg.seqnum != -1 for seg in self.receiveChannel.receiveQueue):
+                self.heard = loop.time()
+            acked = self.layer.highest_ack
+            self.layer.processData()
+            self.sendChannel.processData()
+            if self.layer.highest_ack != acked:
+                async with self.progress:
+                    self.progress.notify_all()
+            if self.closed and loop.time() >= self.lingerDeadline():
+                break
+
+            # Segments a socket channel read while flushing, or sends that don't need an ack to go out
+            if self.receiveChannel.receiveQueue or self.layer.hasPendingSend():
+                await asyncio.sleep(0)
+                continue
+
+            deadline = self.layer.nextTimeout()
+            if self.closed:
+                deadline = min(deadline, self.lingerDeadline()) if deadline is not None else self.lingerDeadline()
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    # ################################################################################################################ #
+    # send()                                                                                                           #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Queues bytes for the peer. Returns once the unacknowledged data is back under SEND_BUFFER_SIZE                   #
+    # ################################################################################################################ #
+    async def send(self, data):
+        if self.source is None:
+            self.source = AppendSource()
+            self.layer.setDataSource(self.source)
+        self.source.append(data)
+        self.wakeup.set()
+        await self.waitFor(lambda: self.source.end - self.layer.highest_ack <= SEND_BUFFER_SIZE)
+
+    # A connection that never received data has nothing to ack and stops at once
+    def lingerDeadline(self):
+        if self.heard is None:
+            return 0.0
+        return self.heard + LINGER_RTOS * self.layer.rttEstimator.maxRto
+
+    # Returns once every byte sent so far is acknowledged
+    async def drain(self):
+        if self.source is not None:
+            await self.waitFor(self.layer.isSendComplete)
+
+    async def waitFor(self, predicate):
+        async with self.progress:
+            await self.progress.wait_for(predicate)
+
+    # ################################################################################################################ #
+    # recv()                                                                                                           #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # The next run of data delivered in order, or b'' once the connection is closed and everything was read            #
+    # ################################################################################################################ #
+    async def recv(self):
+        try:
+            return await self.delivered.__anext__()
+        except StopAsyncIteration:
+            return b''
+
+    # Drains what was sent, lingers until the peer goes quiet, then stops the task
+    async def close(self):
+        await self.drain()
+        self.closed = True
+        self.wakeup.set()
+        await self.task
+        if hasattr(self.receiveChannel, 'fileno'):
+            asyncio.get_running_loop().remove_reader(self.receiveChannel.fileno())
+        self.delivered.close()
+
+
+# #################################################################################################################### #
+# openConnectionPair()                                                                                                 #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# A sending and a receiving Connection joined by two AsyncChannels, configured like rdt_main.py's client and server.   #
+# emulate turns on every loss flag of both channels. maxRto is kept low because it bounds how long closes linger       #
+# #################################################################################################################### #
+def openConnectionPair(emulate=False, latency=0.0, seed=None):
+    rng = random.Random(seed)
+    forward = AsyncChannel(emulate, emulate, emulate, emulate, latency, rng.random())
+    backward = AsyncChannel(emulate, emulate, emulate, emulate, latency, rng.random())
+    loop = asyncio.get_running_loop()
+
+    sender = RDTLayer()
+    sender.setSelectiveAck(True)
+    sender.setCongestionControl(WestwoodCongestionControl(DATA_LENGTH))
+    sender.setMaxBurst(MAX_BURST)
+    sender.setRetransmissionTimer(RttEstimator(initialRto=1.0, minRto=0.2, maxRto=2.0, granularity=0.001),
+                                  loop.time)
+    receiver = RDTLayer()
+    receiver.setSelectiveAck(True)
+    receiver.setRetransmissionTimer(RttEstimator(initialRto=1.0, minRto=0.2, maxRto=2.0, granularity=0.001),
+                                    loop.time)
+    return Connection(sender, forward, backward), Connection(receiver, backward, forward)
@@ -0,0 +1,226 @@
+import heapq
+import math
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# #################################################################################################################### #
+# FastUnreliableChannel                                                                                                #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# A drop-in for UnreliableChannel (same constructor flags, send/receive/processData and stats counters) for large      #
+# simulations. Loss, delay, corruption and latency are drawn for the whole batch at once (with NumPy when it is        #
+# installed, the random module otherwise) and every segment that is not delivered right away waits in a min-heap keyed #
+# by its release iteration instead of a list scanned every iteration.                                                  #
+#                                                                                                                      #
+# On top of the original behaviour it can model a link:                                                                #
+#   seed        seeds the channel's own generator, independent of the global random state                              #
+#   latency     iterations every segment spends on the link                                                            #
+#   jitter      mean of an exponentially distributed extra latency, in iterations                                      #
+#   bandwidth   segments the link carries per iteration, the rest queue behind them                                    #
+#   queueLimit  segments that may queue for the link before new ones are tail-dropped                                  #
+#   generator   'numpy' or 'random' to draw from that one, NumPy when it is installed by default. They are different   #
+#               streams, so a seeded run only repeats with the same generator                                          #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# The ratios are class attributes like UnreliableChannel's and can be overridden per instance. Delayed segments are    #
+# released on time even in iterations where nothing new is sent.                                                       #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+class FastUnreliableChannel(object):
+    RATIO_DROPPED_PACKETS = 0.1
+    RATIO_DELAYED_PACKETS = 0.1
+    RATIO_DATA_ERROR_PACKETS = 0.1
+    RATIO_OUT_OF_ORDER_PACKETS = 0.1
+    ITERATIONS_TO_DELAY_PACKETS = 5
+
+    def __init__(self, canDeliverOutOfOrder_, canDropPackets_, canDelayPackets_, canHaveChecksumErrors_,
+                 seed=None, latency=0, jitter=0, bandwidth=None, queueLimit=None, generator=None):
+        self.sendQueue = []
+        self.receiveQueue = []
+        self.delayedPackets = []        # Heap of (release iteration, arrival order, segment)
+        self.canDeliverOutOfOrder = canDeliverOutOfOrder_
+        self.canDropPackets = canDropPackets_
+        self.canDelayPackets = canDelayPackets_
+        self.canHaveChecksumErrors = canHaveChecksumErrors_
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.queueLimit = queueLimit
+        self.linkFreeAt = 0.0           # When the link finishes the segments already queued for it
+        self.order = 0
+        if generator is None:
+            generator = 'numpy' if numpy is not None else 'random'
+        if generator == 'numpy':
+            if numpy is None:
+                raise ValueError("the numpy generator needs NumPy installed")
+            self.rng = numpy.random.default_rng(seed)
+        elif generator == 'random':
+            self.rng = random.Random(seed)
+        else:
+            raise ValueError("unknown generator {0!r}".format(generator))
+        self.generator = generator
+        # stats
+        self.countTotalDataPackets = 0
+        self.countSentPackets = 0
+        self.countChecksumErrorPackets = 0
+        self.countDroppedPackets = 0
+        self.countDelayedPackets = 0
+        self.countOutOfOrderPackets = 0
+        self.countAckPackets = 0
+        self.currentIteration = 0
+
+    def send(self,seg):
+        self.sendQueue.append(seg)
+
+    def receive(self):
+        new_list = self.receiveQueue
+        self.receiveQueue = []
+        return new_list
+
+    def processData(self):
+        self.currentIteration += 1
+        now = self.currentIteration
+
+        # Release everything that is due, in release order
+        heap = self.delayedPackets
+        while heap and heap[0][0] <= now:
+            self.receiveQueue.append(heapq.heappop(heap)[2])
+            self.countSentPackets += 1
+
+        if len(self.sendQueue) == 0:
+            return
+        batch = self.sendQueue
+        self.sendQueue = []
+
+        if self.canDeliverOutOfOrder and self.rng.random() <= self.RATIO_OUT_OF_ORDER_PACKETS:
+            self.countOutOfOrderPackets += 1
+            batch.reverse()
+
+        queued = None
+        if self.bandwidth:
+            batch, queued = self.throttle(batch, now)
+        if not batch:
+            return
+
+        if self.generator == 'numpy':
+            self.processBatchVectorized(batch, queued, now)
+        else:
+            self.processBatch(batch, queued, now)
+
+    # ################################################################################################################ #
+    # throttle()                                                                                                       #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Puts the batch on the link one segment after another. Returns the segments that fit in the link's queue and how  #
+    # many iterations each one waits for the link                                                                      #
+    # ################################################################################################################ #
+    def throttle(self, batch, now):
+        kept = []
+        queued = []
+        for seg in batch:
+            start = max(now, self.linkFreeAt)
+            if self.queueLimit is not None and (start - now) * self.bandwidth >= self.queueLimit:
+                # Tail drop, the link's queue is full
+                self.countDroppedPackets += 1
+                continue
+            self.linkFreeAt = start + 1.0 / self.bandwidth
+            kept.append(seg)
+            queued.append(int(start - now))
+        return kept, queued
+
+    # The decisions of processBatchVectorized() one segment at a time, for when NumPy is not installed
+    def processBatch(self, batch, queued, now):
+        r = self.rng.random
+        delayRatio = self.RATIO_DELAYED_PACKETS if self.canDelayPackets else -1
+        dropRatio = self.RATIO_DROPPED_PACKETS if self.canDropPackets else -1
+        errorRatio = self.RATIO_DATA_ERROR_PACKETS if self.canHaveChecksumErrors else -1
+
+        for i, seg in enumerate(batch):
+            delayed, dropped, error, jitter = r(), r(), r(), r()
+            release = now + self.latency
+            if self.jitter:
+                release += int(-math.log(1.0 - jitter) * self.jitter)
+            if queued:
+                release += queued[i]
+
+            if delayed <= delayRatio:
+                self.countDelayedPackets += 1
+                seg.setStartDelayIteration(now)
+                self.schedule(release + self.ITERATIONS_TO_DELAY_PACKETS, seg)
+                continue
+
+            if dropped <= dropRatio:
+                self.countDroppedPackets += 1
+            elif release > now:
+                self.schedule(release, seg)
+            else:
+                self.receiveQueue.append(seg)
+                self.countSentPackets += 1
+
+            if seg.seqnum != -1:
+                self.countTotalDataPackets += 1
+
+                # only data packets can have checksum errors...
+                if error <= errorRatio:
+                    seg.createChecksumError(self.rng)
+                    self.countChecksumErrorPackets += 1
+            else:
+                # count ack packets...
+                self.countAckPackets += 1
+
+    # ################################################################################################################ #
+    # processBatchVectorized()                                                                                         #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Draws every decision for the batch in one call and routes the segments by mask, so the only per-segment Python   #
+    # work left is moving them to the receive queue or the heap                                                        #
+    # ################################################################################################################ #
+    def processBatchVectorized(self, batch, queued, now):
+        n = len(batch)
+        u = self.rng.random((4, n))
+        isData = numpy.fromiter([seg.seqnum != -1 for seg in batch], dtype=bool, count=n)
+        delayed = u[0] <= (self.RATIO_DELAYED_PACKETS if self.canDelayPackets else -1)
+        passing = ~delayed
+        dropped = passing & (u[1] <= (self.RATIO_DROPPED_PACKETS if self.canDropPackets else -1))
+        errors = passing & isData & (u[2] <= (self.RATIO_DATA_ERROR_PACKETS if self.canHaveChecksumErrors else -1))
+
+        release = numpy.full(n, now + self.latency, dtype=numpy.int64)
+        if self.jitter:
+            release += (-numpy.log1p(-u[3]) * self.jitter).astype(numpy.int64)
+        if queued:
+            release += numpy.array(queued, dtype=numpy.int64)
+
+        for i in numpy.flatnonzero(delayed).tolist():
+            batch[i].setStartDelayIteration(now)
+            self.schedule(int(release[i]) + self.ITERATIONS_TO_DELAY_PACKETS, batch[i])
+
+        arriving = passing & ~dropped
+        if self.latency or self.jitter or queued:
+            later = arriving & (release > now)
+            for i in numpy.flatnonzero(later).tolist():
+                self.schedule(int(release[i]), batch[i])
+            arriving &= ~later
+        delivered = numpy.flatnonzero(arriving).tolist()
+        self.receiveQueue.extend([batch[i] for i in delivered])
+
+        for i in numpy.flatnonzero(errors).tolist():
+            batch[i].createChecksumError(self.rng)
+
+        dataCount = int(numpy.count_nonzero(isData & passing))
+        self.countDelayedPackets += int(numpy.count_nonzero(delayed))
+        self.countDroppedPackets += int(numpy.count_nonzero(dropped))
+        self.countSentPackets += len(delivered)
+        self.countTotalDataPackets += dataCount
+        self.countAckPackets += int(numpy.count_nonzero(passing)) - dataCount
+        self.countChecksumErrorPackets += int(numpy.count_nonzero(errors))
+
+    def schedule(self, release, seg):
+        self.order += 1
+        heapq.heappush(self.delayedPackets, (release, self.order, seg))
@@ -0,0 +1,191 @@
+import struct
+from collections import OrderedDict
+
+
+# #################################################################################################################### #
+# Forward Error Correction                                                                                             #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# XOR parity over groups of consecutive data segments. The sender emits one parity segment after every group of K      #
+# members; a receiver holding all but one member and the parity rebuilds the missing one without a retransmission.     #
+#                                                                                                                      #
+# Parity payload (network byte order):                                                                                 #
+#   group end q | xor of member byte lengths I | text B | member count B | member length H per member                  #
+#   then the XOR of the members' raw payloads, each zero-padded to the longest                                         #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# The parity segment's seqnum is the seq of its first member and it has FLAG_PARITY set. Member lengths are in seq     #
+# units (characters), byte lengths are of the raw payloads, which differ for non-ASCII text.                           #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+PARITY_HEADER = struct.Struct('!qIBB')
+MEMBER_LENGTH = struct.Struct('!H')
+
+MIN_GROUP = 2
+MAX_GROUP = 16
+
+
+def rawBytes(payload):
+    if isinstance(payload, str):
+        return payload.encode('utf-8')
+    return bytes(payload)
+
+
+def xorInto(acc, raw):
+    # Big ints XOR a whole payload at once. acc is zero-padded to the longer of the two
+    length = max(len(acc), len(raw))
+    value = int.from_bytes(acc.ljust(length, b'\0'), 'big') ^ int.from_bytes(raw.ljust(length, b'\0'), 'big')
+    return value.to_bytes(length, 'big')
+
+
+# #################################################################################################################### #
+# ParityEncoder                                                                                                        #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Sender side. add() takes each new data segment's payload in seq order and returns a parity payload when a group is   #
+# complete, flush() closes a short group at the end of the data. With adaptive set, K follows the residual loss rate:  #
+# the share of sent segments that still had to be retransmitted. Above HIGH_LOSS K halves, below LOW_LOSS it grows     #
+# by one, once per MEASURE_SEGMENTS segments sent.                                                                     #
+# #################################################################################################################### #
+class ParityEncoder(object):
+    MEASURE_SEGMENTS = 64
+    HIGH_LOSS = 0.02
+    LOW_LOSS = 0.005
+
+    def __init__(self, groupSize=4, adaptive=True):
+        self.groupSize = min(max(groupSize, MIN_GROUP), MAX_GROUP)
+        self.adaptive = adaptive
+        self.start = None           # Seq of the open group's first member
+        self.lengths = []           # Open group's member lengths
+        self.parity = b''           # XOR of the open group's raw payloads
+        self.lengthXor = 0
+        self.text = False
+        self.countSent = 0          # First transmissions in the current measurement
+        self.countLost = 0          # Retransmissions in the current measurement
+        self.countParity = 0
+
+    def add(self, seq, payload):
+        if self.start is None:
+            self.start = seq
+            self.text = isinstance(payload, str)
+        raw = rawBytes(payload)
+        self.lengths.append(len(payload))
+        self.parity = xorInto(self.parity, raw)
+        self.lengthXor ^= len(raw)
+        if len(self.lengths) >= self.groupSize:
+            return self.flush()
+        return None
+
+    def flush(self):
+        if self.start is None:
+            return None
+        end = self.start + sum(self.lengths)
+        payload = PARITY_HEADER.pack(end, self.lengthXor, self.text, len(self.lengths))
+        payload += b''.join(MEMBER_LENGTH.pack(length) for length in self.lengths) + self.parity
+        start = self.start
+        self.start = None
+        self.lengths = []
+        self.parity = b''
+        self.lengthXor = 0
+        self.countParity += 1
+        return start, payload
+
+    def onSent(self, count):
+        self.countSent += count
+        if self.adaptive and self.countSent >= ParityEncoder.MEASURE_SEGMENTS:
+            loss = self.countLost / self.countSent
+            if loss > ParityEncoder.HIGH_LOSS:
+                self.groupSize = max(MIN_GROUP, self.groupSize // 2)
+            elif loss < ParityEncoder.LOW_LOSS:
+                self.groupSize = min(MAX_GROUP, self.groupSize + 1)
+            self.countSent = 0
+            self.countLost = 0
+
+    def onLost(self, count):
+        self.countLost += count
+
+
+# #################################################################################################################### #
+# ParityDecoder                                                                                                        #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Receiver side. Keeps the payloads of recently received segments and the parities of groups not yet complete, and     #
+# rebuilds a member once it is the only one missing from its group. Members more than MAX_GROUP segments below the     #
+# delivered offset can no longer be needed and are forgotten.                                                          #
+# #################################################################################################################### #
+class ParityDecoder(object):
+    def __init__(self, segmentLength):
+        self.span = MAX_GROUP * segmentLength
+        self.members = OrderedDict()    # Seq -> payload, in arrival order
+        self.parities = {}              # Group start -> parsed parity
+        self.countRecovered = 0
+
+    def setSegmentLength(self, segmentLength):
+        self.span = MAX_GROUP * segmentLength
+
+    def addMember(self, seq, payload):
+        self.members[seq] = payload
+
+    def addParity(self, start, payload):
+        end, lengthXor, text, count = PARITY_HEADER.unpack_from(payload)
+        offset = PARITY_HEADER.size
+        lengths = [MEMBER_LENGTH.unpack_from(payload, offset + i * MEMBER_LENGTH.size)[0] for i in range(count)]
+        offset += count * MEMBER_LENGTH.size
+        self.parities[start] = (end, lengthXor, text, lengths, bytes(payload[offset:]))
+
+    # ################################################################################################################ #
+    # recover()                                                                                                        #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Returns (seq, payload) for every member that can be rebuilt, given that everything below delivered is in         #
+    # ################################################################################################################ #
+    def recover(self, delivered):
+        recovered = []
+        for start in list(self.parities):
+            end, lengthXor, text, lengths, parity = self.parities[start]
+            if end <= delivered:
+                del self.parities[start]
+                continue
+            missing = None
+            seq = start
+            for length in lengths:
+                if seq not in self.members and seq + length > delivered:
+                    if missing is not None:
+                        break
+                    missing = (seq, length)
+                seq += length
+            else:
+                if missing is None:
+                    del self.parities[start]
+                    continue
+                rebuilt = self.rebuild(start, missing[0], lengths, lengthXor, parity)
+                if rebuilt is None:
+                    continue
+                del self.parities[start]
+                payload = rebuilt.decode('utf-8', 'replace') if text else rebuilt
+                self.members[missing[0]] = payload
+                self.countRecovered += 1
+                recovered.append((missing[0], payload))
+
+        # Forget members no open group can use
+        while self.members:
+            seq = next(iter(self.members))
+            if seq + self.span >= delivered:
+                break
+            self.members.popitem(last=False)
+        return recovered
+
+    def rebuild(self, start, missingSeq, lengths, lengthXor, parity):
+        seq = start
+        for length in lengths:
+            if seq != missingSeq:
+                payload = self.members.get(seq)
+                # Delivered before the decoder kept members, nothing to rebuild from
+                if payload is None:
+                    return None
+                raw = rawBytes(payload)
+                parity = xorInto(parity, raw)
+                lengthXor ^= len(raw)
+            seq += length
+        return parity[:lengthXor]
@@ -0,0 +1,284 @@
+import bisect
+import json
+import os
+import re
+import time
+
+
+# #################################################################################################################### #
+# Metrics                                                                                                              #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# A registry of counters, gauges, histograms and per-phase timers for one RDTLayer or channel, with an optional trace  #
+# of timestamped events. Registries are exported together as JSON, Prometheus text format or a Chrome trace file       #
+# (chrome://tracing, https://ui.perfetto.dev).                                                                         #
+#                                                                                                                      #
+#   metrics = Metrics('client', trace=True)                                                                            #
+#   client.setMetrics(metrics)                                                                                         #
+#   channel = MeteredChannel(UnreliableChannel(...), Metrics('clientToServer', trace=True))                            #
+#   ...                                                                                                                #
+#   writeMetrics('metrics.prom', [metrics, channel.metrics])                                                           #
+#   writeChromeTrace('trace.json', [metrics, channel.metrics])                                                         #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# Nothing is measured unless a registry is set, and events are only recorded with trace on. Counters that the layer    #
+# and the channels already keep (countSegmentTimeouts, countDroppedPackets, ...) are read by collectors at export      #
+# time rather than counted twice. Times are from the registry's clock, time.perf_counter() by default.                 #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+TRACE_LIMIT = 1000000       # events a registry keeps, later ones are only counted
+
+
+def exponentialBuckets(start, factor, count):
+    return [start * factor ** i for i in range(count)]
+
+
+TIME_BUCKETS = exponentialBuckets(0.000001, 4, 14)      # 1us to ~67s
+RTT_BUCKETS = exponentialBuckets(0.0001, 4, 16)         # seconds or iterations, whichever clock the layer runs on
+DEPTH_BUCKETS = exponentialBuckets(1, 2, 21)            # 1 to ~1M
+
+
+# #################################################################################################################### #
+# Histogram                                                                                                            #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Counts of observed values per bucket, each bucket holding the values up to its upper bound, plus their sum           #
+# #################################################################################################################### #
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)     # The last one is for values above every bound
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    # (upper bound, values up to it) per bucket, the last bound is infinite
+    def cumulative(self):
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + [float('inf')], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def toDict(self):
+        return {'count': self.count, 'sum': self.sum,
+                'buckets': [[bound if bound != float('inf') else '+Inf', count] for bound, count in self.cumulative()]}
+
+
+# #################################################################################################################### #
+# Metrics                                                                                                              #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# The registry. Counters only go up, gauges hold the latest value, histograms and phase timers count values per        #
+# bucket, see Histogram                                                                                                #
+# #################################################################################################################### #
+class Metrics(object):
+    def __init__(self, name, trace=False, clock=time.perf_counter):
+        self.name = name
+        self.tracing = trace
+        self.clock = clock
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.phases = {}                # Phase name -> Histogram of its durations
+        self.events = []                # (phase, name, start, duration, args) while tracing
+        self.countDroppedEvents = 0
+        self.collectors = []            # Callables that refresh counters from their source, see collect()
+
+    def inc(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def setCounter(self, name, value):
+        self.counters[name] = value
+
+    # Sets a gauge. While tracing, its value over time goes in the trace as a counter track
+    def setGauge(self, name, value):
+        self.gauges[name] = value
+        if self.tracing:
+            self.record('C', name, self.clock(), 0, {name: value})
+
+    def observe(self, name, value, buckets=DEPTH_BUCKETS):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(buckets)
+        histogram.observe(value)
+
+    # ################################################################################################################ #
+    # phase()                                                                                                          #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Times the phase that began at start (a clock() reading) and ended now. Returns now so consecutive phases can be  #
+    # timed with one clock reading each                                                                                #
+    # ################################################################################################################ #
+    def phase(self, name, start):
+        end = self.clock()
+        histogram = self.phases.get(name)
+        if histogram is None:
+            histogram = self.phases[name] = Histogram(TIME_BUCKETS)
+        histogram.observe(end - start)
+        if self.tracing:
+            self.record('X', name, start, end - start, None)
+        return end
+
+    # A point event such as a segment sent, recorded only while tracing. Callers check tracing before building args
+    def event(self, name, args=None):
+        if self.tracing:
+            self.record('i', name, self.clock(), 0, args)
+
+    def record(self, phase, name, start, duration, args):
+        if len(self.events) >= TRACE_LIMIT:
+            self.countDroppedEvents += 1
+            return
+        self.events.append((phase, name, start, duration, args))
+
+    def addCollector(self, collector):
+        self.collectors.append(collector)
+
+    def collect(self):
+        for collector in self.collectors:
+            collector(self)
+
+    def toDict(self):
+        self.collect()
+        return {'name': self.name, 'counters': dict(self.counters), 'gauges': dict(self.gauges),
+                'histograms': dict((name, h.toDict()) for name, h in self.histograms.items()),
+                'phases': dict((name, h.toDict()) for name, h in self.phases.items()),
+                'events': len(self.events), 'droppedEvents': self.countDroppedEvents}
+
+
+# #################################################################################################################### #
+# MeteredChannel                                                                                                       #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Wraps any channel (UnreliableChannel, FastUnreliableChannel, UdpChannel) to time its processData(), sample its       #
+# queue depths and report its count* statistics, without changing the channel. Everything else is passed through,      #
+# but attributes set on the wrapper, such as ratio overrides, don't reach the channel: set them on .channel.           #
+# #################################################################################################################### #
+class MeteredChannel(object):
+    def __init__(self, channel, metrics):
+        self.channel = channel
+        self.metrics = metrics
+        metrics.addCollector(self.collect)
+
+    def __getattr__(self, name):
+        return getattr(self.channel, name)
+
+    def send(self, seg):
+        self.channel.send(seg)
+
+    def receive(self):
+        return self.channel.receive()
+
+    def processData(self):
+        channel = self.channel
+        metrics = self.metrics
+        dropped = channel.countDroppedPackets
+        corrupted = channel.countChecksumErrorPackets
+        metrics.observe('sendQueueDepth', len(channel.sendQueue))
+        start = metrics.clock()
+        channel.processData()
+        metrics.phase('processData', start)
+        metrics.observe('receiveQueueDepth', len(channel.receiveQueue))
+        metrics.observe('delayedDepth', len(channel.delayedPackets))
+        if metrics.tracing:
+            if channel.countDroppedPackets > dropped:
+                metrics.event('drop', {'count': channel.countDroppedPackets - dropped})
+            if channel.countChecksumErrorPackets > corrupted:
+                metrics.event('corrupt', {'count': channel.countChecksumErrorPackets - corrupted})
+
+    def collect(self, metrics):
+        for name, value in vars(self.channel).items():
+            if name.startswith('count') and isinstance(value, int):
+                metrics.setCounter(name[5].lower() + name[6:], value)
+
+
+def metricName(name):
+    return re.sub(r'(?<=[a-z0-9])([A-Z])', r'_\1', name).lower()
+
+
+# #################################################################################################################### #
+# toPrometheus()                                                                                                       #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Prometheus text exposition format, every metric prefixed rdt_ and labelled with its registry's name. Phase timers    #
+# are the histogram rdt_phase_seconds labelled by phase                                                                #
+# #################################################################################################################### #
+def toPrometheus(registries):
+    families = {}       # Metric name -> (type, [sample lines])
+
+    def add(name, kind, line):
+        families.setdefault(name, (kind, []))[1].append(line)
+
+    def addHistogram(name, labels, histogram):
+        for bound, count in histogram.cumulative():
+            le = '+Inf' if bound == float('inf') else repr(float(bound))
+            add(name, 'histogram', '{0}_bucket{{{1},le="{2}"}} {3}'.format(name, labels, le, count))
+        add(name, 'histogram', '{0}_sum{{{1}}} {2}'.format(name, labels, histogram.sum))
+        add(name, 'histogram', '{0}_count{{{1}}} {2}'.format(name, labels, histogram.count))
+
+    for registry in registries:
+        registry.collect()
+        labels = 'registry="{0}"'.format(registry.name)
+        for name, value in sorted(registry.counters.items()):
+            metric = 'rdt_' + metricName(name) + '_total'
+            add(metric, 'counter', '{0}{{{1}}} {2}'.format(metric, labels, value))
+        for name, value in sorted(registry.gauges.items()):
+            metric = 'rdt_' + metricName(name)
+            add(metric, 'gauge', '{0}{{{1}}} {2}'.format(metric, labels, value))
+        for name, histogram in sorted(registry.histograms.items()):
+            addHistogram('rdt_' + metricName(name), labels, histogram)
+        for name, histogram in sorted(registry.phases.items()):
+            addHistogram('rdt_phase_seconds', '{0},phase="{1}"'.format(labels, name), histogram)
+
+    lines = []
+    for name, (kind, samples) in families.items():
+        lines.append('# TYPE {0} {1}'.format(name, kind))
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+def toJson(registries):
+    return json.dumps([registry.toDict() for registry in registries], indent=2)
+
+
+# #################################################################################################################### #
+# chromeTrace()                                                                                                        #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# The registries' events in Chrome trace event format, one thread per registry, timestamps in microseconds             #
+# #################################################################################################################### #
+def chromeTrace(registries):
+    pid = os.getpid()
+    events = []
+    for tid, registry in enumerate(registries):
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': registry.name}})
+        for phase, name, start, duration, args in registry.events:
+            event = {'name': name, 'ph': phase, 'pid': pid, 'tid': tid, 'ts': start * 1e6}
+            if phase == 'X':
+                event['dur'] = duration * 1e6
+            elif phase == 'i':
+                event['s'] = 't'
+            elif phase == 'C':
+                event['name'] = '{0}.{1}'.format(registry.name, name)
+            if args is not None:
+                event['args'] = args
+            events.append(event)
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+# Prometheus text for a .prom or .txt path, JSON otherwise
+def writeMetrics(path, registries):
+    text = toPrometheus(registries) if os.path.splitext(path)[1] in ('.prom', '.txt') else toJson(registries)
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def writeChromeTrace(path, registries):
+    with open(path, 'w') as f:
+        json.dump(chromeTrace(registries), f)
@@ -0,0 +1,199 @@
+import heapq
+from collections import deque
+
+from rdt_layer import RDTLayer
+from packedsegment import FLAG_PARITY
+
+
+# #################################################################################################################### #
+# Multiplexer                                                                                                          #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Runs many RDTLayer flows over one send/receive channel pair. Every segment carries its flow's connection ID          #
+# (PackedSegment.connId). Incoming segments are demultiplexed through a dict of per-flow state, and outgoing segments  #
+# share the send channel round-robin, one segment per flow per turn.                                                   #
+#                                                                                                                      #
+# A flow's layer only runs in an iteration where it has work: segments arrived for it, its earliest retransmission     #
+# timer expired (a heap of deadlines) or it has sends that don't wait for an ack. Idle flows cost nothing. Segments    #
+# wait in their flow's queue for a turn, and their retransmission timers start when they get one.                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# A flow's layer is kept on the multiplexer's iteration count, so its timers must run on iterations (no clock given to #
+# setRetransmissionTimer()).                                                                                           #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+# #################################################################################################################### #
+# FlowChannel                                                                                                          #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# The channel a flow's layer sees. send() queues for the shared channel, receiveQueue is filled by the multiplexer.    #
+# A data segment resent while an earlier copy still waits takes that copy's place instead of queueing twice.           #
+# #################################################################################################################### #
+class FlowChannel(object):
+    def __init__(self, mux, connId):
+        self.mux = mux
+        self.connId = connId
+        self.sendQueue = deque()        # Segments waiting for their turn on the shared channel
+        self.queued = set()             # Seqs of the data segments in sendQueue
+        self.receiveQueue = []
+
+    def send(self,seg):
+        isData = seg.seqnum != -1 and not seg.flags & FLAG_PARITY
+        if isData and seg.seqnum in self.queued:
+            for i, waiting in enumerate(self.sendQueue):
+                if waiting.seqnum == seg.seqnum and not waiting.flags & FLAG_PARITY:
+                    self.sendQueue[i] = seg
+                    return
+        if not self.sendQueue:
+            self.mux.ready.append(self.connId)
+        self.sendQueue.append(seg)
+        if isData:
+            self.queued.add(seg.seqnum)
+
+    # The next segment for the shared channel
+    def pop(self):
+        seg = self.sendQueue.popleft()
+        self.queued.discard(seg.seqnum)
+        return seg
+
+    def receive(self):
+        new_list = self.receiveQueue
+        self.receiveQueue = []
+        return new_list
+
+
+class Flow(object):
+    __slots__ = ('layer', 'channel', 'timer')
+
+    def __init__(self, layer, channel):
+        self.layer = layer
+        self.channel = channel
+        self.timer = None               # Deadline pushed on the multiplexer's timer heap, older entries are stale
+
+
+class Multiplexer(object):
+    # ################################################################################################################ #
+    # __init__()                                                                                                       #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # accept(connId) is called for a segment of an unknown flow and returns the RDTLayer to run it, or None to drop    #
+    # it. sendBudget caps the segments put on the send channel per iteration, None for no cap                          #
+    # ################################################################################################################ #
+    def __init__(self, sendChannel, receiveChannel, accept=None, sendBudget=None):
+        self.sendChannel = sendChannel
+        self.receiveChannel = receiveChannel
+        self.accept = accept
+        self.sendBudget = sendBudget
+        self.flows = {}                 # connId -> Flow
+        self.active = {}                # connIds to run this iteration, in arrival order
+        self.timers = []                # Heap of (deadline, connId)
+        self.ready = deque()            # connIds with segments waiting to send, in round-robin order
+        self.currentIteration = 0
+        self.countUnknownFlowSegments = 0
+
+    # ################################################################################################################ #
+    # openFlow()                                                                                                       #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Adds a flow and returns its layer, a new RDTLayer unless one is given                                            #
+    # ################################################################################################################ #
+    def openFlow(self, connId, layer=None):
+        if connId in self.flows:
+            raise ValueError("connection {0} is already open".format(connId))
+        if layer is None:
+            layer = RDTLayer()
+        channel = FlowChannel(self, connId)
+        layer.setConnectionId(connId)
+        layer.setSendChannel(channel)
+        layer.setReceiveChannel(channel)
+        self.flows[connId] = Flow(layer, channel)
+        self.active[connId] = None
+        return layer
+
+    # Forgets the flow. Its queued segments are discarded
+    def closeFlow(self, connId):
+        self.flows.pop(connId, None)
+        self.active.pop(connId, None)
+
+    def getFlow(self, connId):
+        flow = self.flows.get(connId)
+        return flow.layer if flow is not None else None
+
+    # ################################################################################################################ #
+    # processData()                                                                                                    #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # "timeslice". Called by main once per iteration, in place of the layers' own processData()                        #
+    # ################################################################################################################ #
+    def processData(self):
+        self.currentIteration += 1
+        now = self.currentIteration
+
+        # Demultiplex by connection ID
+        for seg in self.receiveChannel.receive():
+            flow = self.flows.get(seg.connId)
+            if flow is None:
+                layer = self.accept(seg.connId) if self.accept is not None else None
+                if layer is None:
+                    self.countUnknownFlowSegments += 1
+                    continue
+                self.openFlow(seg.connId, layer)
+                flow = self.flows[seg.connId]
+            flow.channel.receiveQueue.append(seg)
+            self.active[seg.connId] = None
+
+        # Flows whose timer is due. Entries for a deadline that has since moved are skipped
+        while self.timers and self.timers[0][0] <= now:
+            deadline, connId = heapq.heappop(self.timers)
+            flow = self.flows.get(connId)
+            if flow is not None and flow.timer == deadline:
+                flow.timer = None
+                self.active[connId] = None
+
+        active = self.active
+        self.active = {}
+        for connId in active:
+            flow = self.flows.get(connId)
+            if flow is not None:
+                self.runFlow(connId, flow, now)
+
+        self.schedule()
+
+    def runFlow(self, connId, flow, now):
+        layer = flow.layer
+        # processData() adds one, so the flow's timers and congestion control see the multiplexer's iteration
+        layer.currentIteration = now - 1
+        layer.processData()
+
+        if layer.hasPendingSend():
+            self.active[connId] = None
+        deadline = layer.nextTimeout()
+        if deadline is None:
+            flow.timer = None
+        elif max(deadline, now + 1) != flow.timer:
+            flow.timer = max(deadline, now + 1)
+            heapq.heappush(self.timers, (flow.timer, connId))
+
+    # ################################################################################################################ #
+    # schedule()                                                                                                       #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Moves queued segments to the send channel, one per flow per turn, so a flow with a large window can't crowd out  #
+    # the others. Flows still waiting when the budget runs out go first next iteration                                 #
+    # ################################################################################################################ #
+    def schedule(self):
+        budget = self.sendBudget
+        while self.ready and (budget is None or budget > 0):
+            connId = self.ready.popleft()
+            flow = self.flows.get(connId)
+            if flow is None or not flow.channel.sendQueue:
+                continue
+            seg = flow.channel.pop()
+            self.sendChannel.send(seg)
+            flow.layer.transmitted(seg, self.currentIteration)
+            if flow.channel.sendQueue:
+                self.ready.append(connId)
+            if budget is not None:
+                budget -= 1
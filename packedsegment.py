@@ -0,0 +1,214 @@
+import random
+import struct
+import zlib
+
+
+# #################################################################################################################### #
+# PackedSegment                                                                                                        #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Drop-in replacement for Segment with a compact binary wire format. The in-memory form uses __slots__, the checksum   #
+# is a CRC32 over the packed header and the raw payload bytes, and encode()/decode() move it to and from bytes.        #
+#                                                                                                                      #
+# Wire format (network byte order):                                                                                    #
+#   conn id I | seq q | ack q | window I | payload length I | flags B | sack block count B | checksum I                #
+#   then (start q, end q) per sack block, then the payload                                                             #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# str payloads (setDataToSend) travel as UTF-8 with FLAG_TEXT set and come back out of decode() as str. A data         #
+# segment with FLAG_ACK set also carries an ack (addAck()), a pure ack has seq -1. A FLAG_PARITY segment carries the   #
+# XOR parity of a group of data segments, see fec.py. A FLAG_SYN segment has seq -1 and carries the handshake options  #
+# as its payload, segment size I | receive window I | resume offset q; the answer to one also has FLAG_SYN_ACK.        #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+FIELDS = struct.Struct('!IqqIIBB')
+CHECKSUM = struct.Struct('!I')
+SACK_BLOCK = struct.Struct('!qq')
+SYN_OPTIONS = struct.Struct('!IIq')
+HEADER_SIZE = FIELDS.size + CHECKSUM.size
+
+FLAG_ACK = 0x01
+FLAG_TEXT = 0x02
+FLAG_PARITY = 0x04
+FLAG_SYN = 0x08
+FLAG_SYN_ACK = 0x10
+
+
+class PackedSegment(object):
+    __slots__ = ('connId', 'seqnum', 'acknum', 'payload', 'checksum', 'window', 'flags', 'sackBlocks',
+                 'startIteration', 'startDelayIteration')
+
+    def __init__(self):
+        self.connId = 0                 # Flow the segment belongs to, set before the checksum, see multiplex.py
+        self.seqnum = -1
+        self.acknum = -1
+        self.payload = b''
+        self.checksum = 0
+        self.window = 0
+        self.flags = 0
+        self.sackBlocks = ()
+        self.startIteration = 0
+        self.startDelayIteration = 0
+
+    def setData(self,seq,data):
+        self.seqnum = seq
+        self.acknum = -1
+        self.payload = data
+        self.flags = FLAG_TEXT if isinstance(data, str) else 0
+        self.checksum = self.calc_checksum()
+
+    def setAck(self,ack,window=0,sackBlocks=()):
+        self.seqnum = -1
+        self.acknum = ack
+        self.payload = b''
+        self.window = window
+        self.flags = FLAG_ACK
+        self.sackBlocks = tuple(sackBlocks)
+        self.checksum = self.calc_checksum()
+
+    # Parity over the group of data segments starting at seq, see fec.py
+    def setParity(self,seq,parity):
+        self.seqnum = seq
+        self.acknum = -1
+        self.payload = parity
+        self.flags = FLAG_PARITY
+        self.checksum = self.calc_checksum()
+
+    # Handshake offer of a segment size, a receive window and the offset to resume sending from, or the answer to
+    # the peer's
+    def setSyn(self,mss,window,resume=0,answer=False):
+        self.seqnum = -1
+        self.acknum = -1
+        self.payload = SYN_OPTIONS.pack(mss, window, resume)
+        self.flags = FLAG_SYN | (FLAG_SYN_ACK if answer else 0)
+        self.checksum = self.calc_checksum()
+
+    # (segment size, receive window, resume offset) of a verified handshake segment
+    def getSynOptions(self):
+        return SYN_OPTIONS.unpack_from(self.payload)
+
+    # Piggybacks an acknowledgement on a data segment, full duplex
+    def addAck(self,ack,window=0,sackBlocks=()):
+        self.acknum = ack
+        self.window = window
+        self.flags |= FLAG_ACK
+        self.sackBlocks = tuple(sackBlocks)
+        self.checksum = self.calc_checksum()
+
+    # Same segment, checksum included, without recomputing anything
+    def copy(self):
+        seg = PackedSegment()
+        seg.connId = self.connId
+        seg.seqnum = self.seqnum
+        seg.acknum = self.acknum
+        seg.payload = self.payload
+        seg.checksum = self.checksum
+        seg.window = self.window
+        seg.flags = self.flags
+        seg.sackBlocks = self.sackBlocks
+        return seg
+
+    def setStartIteration(self,iteration):
+        self.startIteration = iteration
+
+    def getStartIteration(self):
+        return self.startIteration
+
+    def setStartDelayIteration(self,iteration):
+        self.startDelayIteration = iteration
+
+    def getStartDelayIteration(self):
+        return self.startDelayIteration
+
+    def to_string(self):
+        return "seq: {0}, ack: {1}, data: {2}"\
+        .format(self.seqnum,self.acknum,self.payload if self.flags & FLAG_TEXT else bytes(self.payload))
+
+    def rawPayload(self):
+        if self.flags & FLAG_TEXT:
+            return self.payload.encode('utf-8')
+        return self.payload
+
+    # Header without the checksum, plus the sack blocks
+    def packHeader(self, raw):
+        header = FIELDS.pack(self.connId, self.seqnum, self.acknum, self.window, len(raw), self.flags,
+                             len(self.sackBlocks))
+        for start, end in self.sackBlocks:
+            header += SACK_BLOCK.pack(start, end)
+        return header
+
+    def calc_checksum(self, raw=None):
+        if raw is None:
+            raw = self.rawPayload()
+        return zlib.crc32(raw, zlib.crc32(self.packHeader(raw)))
+
+    def checkChecksum(self):
+        return self.calc_checksum() == self.checksum
+
+    def encode(self):
+        raw = self.rawPayload()
+        header = self.packHeader(raw)
+        return header[:FIELDS.size] + CHECKSUM.pack(self.checksum) + header[FIELDS.size:] + bytes(raw)
+
+    # ################################################################################################################ #
+    # decode()                                                                                                         #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Reads one segment from buffer at offset. Returns the segment and the offset just past it                         #
+    # ################################################################################################################ #
+    @classmethod
+    def decode(cls, buffer, offset=0):
+        seg = cls()
+        seg.connId, seg.seqnum, seg.acknum, seg.window, length, seg.flags, blocks = FIELDS.unpack_from(buffer, offset)
+        seg.checksum, = CHECKSUM.unpack_from(buffer, offset + FIELDS.size)
+        offset += HEADER_SIZE
+        seg.sackBlocks = tuple(SACK_BLOCK.unpack_from(buffer, offset + i * SACK_BLOCK.size) for i in range(blocks))
+        offset += blocks * SACK_BLOCK.size
+        raw = bytes(buffer[offset:offset + length])
+        if len(raw) != length:
+            raise ValueError("truncated segment")
+        seg.payload = raw.decode('utf-8', 'replace') if seg.flags & FLAG_TEXT else raw
+        return seg, offset + length
+
+    def printToConsole(self):
+        print(self.to_string())
+
+    # ################################################################################################################ #
+    # createChecksumError()                                                                                            #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Function to cause an error. Overwrites one character picked with rng, a seeded channel's random.Random or NumPy  #
+    # Generator, with 'X', or 'Y' where it already is 'X' so the segment never stays valid. The payload may be shared  #
+    # with the sender's buffer, so it is replaced, not written                                                         #
+    # ################################################################################################################ #
+    def createChecksumError(self, rng=random):
+        if not self.payload:
+            return
+        i = int(rng.random() * len(self.payload))
+        if self.flags & FLAG_TEXT:
+            char = 'Y' if self.payload[i] == 'X' else 'X'
+            self.payload = self.payload[:i] + char + self.payload[i + 1:]
+        else:
+            char = b'Y' if self.payload[i] == ord('X') else b'X'
+            self.payload = bytes(self.payload[:i]) + char + bytes(self.payload[i + 1:])
+
+
+# #################################################################################################################### #
+# encodeBatch() / decodeBatch()                                                                                        #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Many segments to and from one buffer, for a single write or datagram.                                                #
+# #################################################################################################################### #
+def encodeBatch(segments):
+    return b''.join(seg.encode() for seg in segments)
+
+
+def decodeBatch(buffer):
+    segments = []
+    offset = 0
+    view = memoryview(buffer)
+    while offset < len(view):
+        seg, offset = PackedSegment.decode(view, offset)
+        segments.append(seg)
+    return segments
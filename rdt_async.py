@@ -0,0 +1,77 @@
+from connection import openConnectionPair
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# #################################################################################################################### #
+# Async Main                                                                                                           #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Runs several transfers at once on one asyncio event loop (see connection.py), each a sender and a receiver joined by #
+# in-process channels, and checks that every receiver got exactly what its sender sent. A transfer that hasn't         #
+# finished, closes included, within --timeout seconds is reported instead of hanging the run.                          #
+#                                                                                                                      #
+#   python rdt_async.py --transfers 20 --size 20000 --emulate                                                          #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+WRITE_SIZE = 1024           # bytes per send() call
+
+
+async def transfer(data, args, seed):
+    sender, receiver = openConnectionPair(args.emulate, args.latency, seed)
+
+    async def produce():
+        for offset in range(0, len(data), WRITE_SIZE):
+            await sender.send(data[offset:offset + WRITE_SIZE])
+        await sender.close()
+
+    async def consume():
+        pieces = []
+        received = 0
+        while received < len(data):
+            piece = await receiver.recv()
+            pieces.append(piece)
+            received += len(piece)
+        await receiver.close()
+        return b''.join(pieces)
+
+    start = time.monotonic()
+    producer = asyncio.ensure_future(produce())
+    try:
+        received = await asyncio.wait_for(consume(), args.timeout)
+        await asyncio.wait_for(producer, max(0.0, args.timeout - (time.monotonic() - start)))
+    except asyncio.TimeoutError:
+        producer.cancel()
+        return None, time.monotonic() - start, sender.layer.countSegmentTimeouts
+    return received == data, time.monotonic() - start, sender.layer.countSegmentTimeouts
+
+
+async def main(args):
+    payloads = [os.urandom(args.size) for i in range(args.transfers)]
+    start = time.monotonic()
+    results = await asyncio.gather(*[transfer(data, args, i) for i, data in enumerate(payloads)])
+    elapsed = time.monotonic() - start
+
+    for i, (ok, seconds, timeouts) in enumerate(results):
+        outcome = "TIMED OUT" if ok is None else "OK" if ok else "MISMATCH"
+        print("transfer {0}: {1} in {2:.3f}s, {3} timeouts".format(i, outcome, seconds, timeouts))
+    total = args.size * args.transfers
+    print("{0} bytes in {1:.3f}s, {2:.0f} bytes/s".format(total, elapsed, total / elapsed))
+    if all(ok for ok, seconds, timeouts in results):
+        print('$$$$$$$$ ALL DATA RECEIVED $$$$$$$$')
+        return 0
+    print('######## DATA MISMATCH OR TIMEOUT ########')
+    return 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Many reliable transfers on one asyncio event loop")
+    parser.add_argument('--transfers', type=int, default=10)
+    parser.add_argument('--size', type=int, default=20000)
+    parser.add_argument('--latency', type=float, default=0.0, help="one-way latency of every channel, in seconds")
+    parser.add_argument('--emulate', action='store_true', help="drop/delay/corrupt/reorder at the channel ratios")
+    parser.add_argument('--timeout', type=float, default=120.0, help="seconds a transfer may take, closes included")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,104 @@
+from bench import makeGrid, runBenchmarks, writeJson, writeCsv, saveBaseline, loadBaseline, compareBaseline, \
+    MAX_ITERATIONS, REGRESSION_TOLERANCE, MACHINE_TOLERANCE
+from rdt_layer import RECEIVE_BUFFER_SIZE
+import fastchannel
+import argparse
+import sys
+import time
+
+# #################################################################################################################### #
+# Benchmark Main                                                                                                       #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Runs a seeded parameter sweep (see bench.py) on a pool of worker processes, prints a line per trial and writes the   #
+# results as JSON and/or CSV. With --baseline it exits with status 1 when any trial regressed.                         #
+#                                                                                                                      #
+#   python rdt_bench.py --sizes 1K 100K 1M --mss 100 1000 --drop 0 0.1 0.2 --json results.json --csv results.csv       #
+#   python rdt_bench.py --sizes 100M --mss 60000 --window 10M --workers 1                                              #
+#   python rdt_bench.py --baseline bench_baseline.json --generator random                                              #
+#   python rdt_bench.py --machine --save-baseline mine.json                                                            #
+#   (later) python rdt_bench.py --machine --baseline mine.json                                                         #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# Sizes take K, M and G suffixes (powers of 1000). Every list option is swept against every other one, and --trials    #
+# seeds from --seed on are run per combination. bench_baseline.json is the default sweep with --generator random,      #
+# iterations and retransmission ratio only, so it holds on any machine, NumPy or not; --machine adds wall time and     #
+# peak memory, which have to be recorded on the machine they are compared on. A baseline trial the sweep didn't run    #
+# counts as a regression.                                                                                              #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+SUFFIXES = {'K': 1000, 'M': 1000 ** 2, 'G': 1000 ** 3}
+
+
+def parseSize(text):
+    multiplier = SUFFIXES.get(text[-1:].upper())
+    if multiplier is None:
+        return int(text)
+    return int(float(text[:-1]) * multiplier)
+
+
+def report(result):
+    print("{0}: {1}, {2} iterations, {3:.3f}s, {4:.0f} bytes/s, retransmitted {5:.1%}, peak {6} bytes"
+          .format(result['key'], 'ok' if result['ok'] else 'FAILED', result['iterations'], result['seconds'],
+                  result['goodput'], result['retransmissionRatio'], result['peakMemory']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seeded benchmark sweep of the RDT layer")
+    parser.add_argument('--sizes', type=parseSize, nargs='+', default=[1000, 10000, 100000],
+                        help="payload sizes in bytes")
+    parser.add_argument('--mss', type=int, nargs='+', default=[1000], help="segment sizes each side offers")
+    parser.add_argument('--window', type=parseSize, nargs='+', default=[RECEIVE_BUFFER_SIZE],
+                        help="receive buffers each side advertises")
+    parser.add_argument('--drop', type=float, nargs='+', default=[0.1])
+    parser.add_argument('--delay', type=float, nargs='+', default=[0.1])
+    parser.add_argument('--error', type=float, nargs='+', default=[0.1])
+    parser.add_argument('--reorder', type=float, nargs='+', default=[0.1])
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--trials', type=int, default=3, help="seeds per combination")
+    parser.add_argument('--channel', choices=('fast', 'classic'), default='fast')
+    parser.add_argument('--generator', choices=('numpy', 'random'),
+                        help="what the fast channel draws from, NumPy when it is installed by default")
+    parser.add_argument('--max-iterations', type=int, default=MAX_ITERATIONS)
+    parser.add_argument('--workers', type=int, help="worker processes, os.cpu_count() by default")
+    parser.add_argument('--json', help="file to write the results to as JSON")
+    parser.add_argument('--csv', help="file to write the results to as CSV")
+    parser.add_argument('--baseline', help="baseline to compare against, exit status 1 on a regression")
+    parser.add_argument('--save-baseline', help="file to record these results in as the new baseline")
+    parser.add_argument('--machine', action='store_true',
+                        help="also record and compare seconds and peakMemory, for a baseline recorded on this machine")
+    args = parser.parse_args(argv)
+
+    seeds = range(args.seed, args.seed + args.trials)
+    if args.generator == 'numpy' and (args.channel == 'classic' or fastchannel.numpy is None):
+        parser.error("--generator numpy needs the fast channel and NumPy installed")
+    trials = makeGrid(args.sizes, args.mss, args.window, args.drop, args.delay, args.error, args.reorder, seeds,
+                      args.channel, args.max_iterations, args.generator)
+    start = time.perf_counter()
+    results = runBenchmarks(trials, args.workers, report)
+    print("{0} trials in {1:.3f}s".format(len(results), time.perf_counter() - start))
+
+    if args.json:
+        writeJson(results, args.json)
+    if args.csv:
+        writeCsv(results, args.csv)
+    tolerance = dict(REGRESSION_TOLERANCE, **MACHINE_TOLERANCE) if args.machine else REGRESSION_TOLERANCE
+    if args.save_baseline:
+        saveBaseline(results, args.save_baseline, tolerance)
+
+    failed = [result['key'] for result in results if not result['ok']]
+    for key in failed:
+        print("######## FAILED: {0} ########".format(key))
+    if args.baseline:
+        regressions = compareBaseline(results, loadBaseline(args.baseline), tolerance)
+        for regression in regressions:
+            print("######## REGRESSION: {0} ########".format(regression))
+        if regressions:
+            return 1
+        print('$$$$$$$$ NO REGRESSIONS $$$$$$$$')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
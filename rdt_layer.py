@@ -1,4 +1,16 @@
-from segment import Segment
+from packedsegment import PackedSegment, FLAG_ACK, FLAG_PARITY, FLAG_SYN, FLAG_SYN_ACK, HEADER_SIZE, SACK_BLOCK
+from collections import OrderedDict, deque
+import heapq
+from congestion import FixedWindow, RenoCongestionControl
+from ackpolicy import AckEverySegment
+from fec import ParityEncoder, ParityDecoder
+from rtt import RttEstimator
+from reassembly import ReassemblyBuffer
+from source import StringSource, StreamSource
+from sink import AsyncDeliveryQueue
+from resume import ReceiverCheckpoint, CHECKPOINT_INTERVAL
+from metrics import RTT_BUCKETS
+import logging
 import math
 
 
@@ -16,24 +28,63 @@ import math
 #                                                                                                                      #
 # #################################################################################################################### #
 
-DATA_LENGTH = 4
+DATA_LENGTH = 4             # Default segment size, and the size used until the handshake agrees on one
 FLOW_CONTROL_WIN_SIZE = 15 # in characters          # Receive window size for flow-control
+MAX_SACK_BLOCKS = 4         # Most out-of-order ranges reported in a single ack
+RECEIVE_BUFFER_SIZE = 65535 # in characters        # Data the receiver holds past last_proc_byte
+MAX_SEGMENT_SIZE = 65535    # Largest segment size a layer may offer
+
+# Every segment sent is logged at DEBUG, handshakes and resumes at INFO. Silent unless main configures logging
+logger = logging.getLogger(__name__)
 
 class RDTLayer(object):
     def __init__(self):
         self.sendChannel = None
         self.receiveChannel = None
-        self.dataToSend = ''
+        self.dataSource = None          # Where data segments are cut from, see source.py
+        self.dataSink = None            # Where received data is pushed, None to keep it for getDataReceived()
+        self.peer_window = None         # Receive window last advertised by the other side, None until known
         self.currentIteration = 0
+        self.connId = 0                 # Connection ID stamped on every segment, see multiplex.py
+        self.segmentSize = DATA_LENGTH  # Largest segment this side offers in the handshake
+        self.receiveBufferSize = RECEIVE_BUFFER_SIZE    # Data this side holds past last_proc_byte
+        self.mss = None                 # Segment size both sides agreed on, None until the handshake is done
+        self.syn_sent = None            # [time last sent, times sent] of our SYN, None until one is sent
+        self.syn_owed = False           # Send a SYN this iteration
+        self.syn_ack_owed = False       # Answer a SYN from the peer this iteration
+        self.checkpoint = None          # Output file and saved state of a resumable receive, see resume.py
+        self.metrics = None             # Registry for timers, histograms and the event trace, see metrics.py
+        self.maxBurst = None            # Most segments sent in one iteration, None for the whole window
         # Add items as needed
         self.seq = 0
         self.countSegmentTimeouts = 0
         self.last_proc_byte = 0         # Sending next or resend logic
-        self.send_queue = []            # For maintaining flow controls
-        self.staged_segments = []       # Segments received out of order, awaiting processing
-        self.rcvd_ack = []              # Counting Acks, if freq > 3 it will be resent
-        self.waiting_ack = []           # Seq numbers sent and awaiting Ack
-        self.captured_segments = []     # Segments processed. For final string compare
+        self.send_queue = deque()       # New segments not yet sent, in seq order
+        self.retransmit_heap = []       # Seqs to retransmit ahead of new data, lowest first
+        self.retransmit_pending = set() # Seqs in retransmit_heap
+        self.reassembly = ReassemblyBuffer()    # Delivered data plus segments received out of order
+        self.selectiveAck = False       # Receiver reports buffered ranges, sender retransmits only holes
+        self.congestionControl = FixedWindow(DATA_LENGTH, FLOW_CONTROL_WIN_SIZE)
+        self.highest_ack = 0            # Cumulative ack high-water mark, everything below it is delivered
+        self.dup_acks = {}              # Ack number -> duplicates seen, only highest_ack is kept
+        self.snd_nxt = 0                # End of the highest seq sent so far
+        self.recovery_point = 0         # snd_nxt at the last timeout, later timeouts below it are the same loss event
+        self.countFastRetransmits = 0
+        self.countRetransmissions = 0   # Segments sent again, for timeouts, fast retransmit or SACK holes
+        self.rttEstimator = RttEstimator()
+        self.clock = None               # Callable returning the current time, None for iterations
+        self.sack_seen = {}             # SACK block start -> end already applied to in_flight
+        self.ackPolicy = AckEverySegment()  # When received data is acked, see ackpolicy.py
+        self.fecEncoder = None          # Emits parity segments over groups of sent segments, see fec.py
+        self.fecDecoder = None          # Rebuilds a lost member of a group from its parity
+        self.parity_after = {}          # Seq of a group's last member -> parity segment sent right after it
+        self.acks_owed = deque()        # (ack, window, sack blocks) owed for received segments, oldest first
+        self.outbox = []                # Data segments processSend() chose this iteration, sent by flushSend()
+        self.in_flight = OrderedDict()  # Unacked, unsacked seq -> [time last sent, times sent, segment, timeouts]
+        self.in_flight_bytes = 0        # Payload of in_flight, what the congestion window limits
+        self.delivered = 0              # Data acked or sacked so far, counted when it leaves in_flight
+        self.round_end = None           # snd_nxt when the current round trip began, None between round trips
+        self.round_delivered = 0        # self.delivered when it began
 
     # ################################################################################################################ #
     # setSendChannel()                                                                                                 #
@@ -53,6 +104,15 @@ class RDTLayer(object):
     def setReceiveChannel(self, channel):
         self.receiveChannel = channel
 
+    # ################################################################################################################ #
+    # setConnectionId()                                                                                                #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main (or a Multiplexer) to set the connection ID this layer stamps on its segments                     #
+    # ################################################################################################################ #
+    def setConnectionId(self, connId):
+        self.connId = connId
+
     # ################################################################################################################ #
     # setDataToSend()                                                                                                  #
     #                                                                                                                  #
@@ -60,21 +120,318 @@ class RDTLayer(object):
     # Called by main to set the string data to send                                                                    #                                                                                                                 #
     # ################################################################################################################ #
     def setDataToSend(self,data):
-        self.dataToSend = data
+        self.dataSource = StringSource(data)
+
+    # ################################################################################################################ #
+    # setDataSource()                                                                                                  #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to stream bytes from a file path, a binary file object or an iterator of bytes chunks, instead    #
+    # of holding the whole payload in memory. A source object from source.py is used as is                             #
+    # ################################################################################################################ #
+    def setDataSource(self, source):
+        if not isinstance(source, (StringSource, StreamSource)):
+            source = StreamSource(source)
+        self.dataSource = source
+
+    # ################################################################################################################ #
+    # setSelectiveAck()                                                                                                #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to turn selective acknowledgements (SACK) on or off. Both endpoints should use the same setting   #
+    # ################################################################################################################ #
+    def setSelectiveAck(self, enabled):
+        self.selectiveAck = enabled
+
+    # ################################################################################################################ #
+    # setCongestionControl()                                                                                           #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to pick the engine (see congestion.py) that sizes the send window. Defaults to FixedWindow        #
+    # ################################################################################################################ #
+    def setCongestionControl(self, congestionControl):
+        self.congestionControl = congestionControl
+
+    # ################################################################################################################ #
+    # setMaxBurst()                                                                                                    #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to send at most `segments` per iteration, so a wide window goes out over several. Worth it when   #
+    # the peer runs concurrently: it works through one burst while the next is sent, instead of waiting for all of it  #
+    # ################################################################################################################ #
+    def setMaxBurst(self, segments):
+        self.maxBurst = segments
+
+    # ################################################################################################################ #
+    # setAckPolicy()                                                                                                   #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to pick when received data is acked (see ackpolicy.py). Defaults to AckEverySegment               #
+    # ################################################################################################################ #
+    def setAckPolicy(self, ackPolicy):
+        self.ackPolicy = ackPolicy
+
+    # ################################################################################################################ #
+    # setSegmentSize()                                                                                                 #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to set the largest segment, in characters, this side offers. Both sides use the smaller of the    #
+    # two offers once the handshake is done, and DATA_LENGTH before                                                    #
+    # ################################################################################################################ #
+    def setSegmentSize(self, size):
+        if not 0 < size <= MAX_SEGMENT_SIZE:
+            raise ValueError("segment size must be between 1 and {0}".format(MAX_SEGMENT_SIZE))
+        self.segmentSize = size
+        if self.fecDecoder is not None:
+            self.fecDecoder.setSegmentLength(max(size, DATA_LENGTH))
+
+    # ################################################################################################################ #
+    # setReceiveBuffer()                                                                                               #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to set how much data, in characters, this side holds past last_proc_byte. What is free of it is   #
+    # advertised in the handshake and in every ack, and the peer sends no further ahead                                #
+    # ################################################################################################################ #
+    def setReceiveBuffer(self, size):
+        self.receiveBufferSize = size
+
+    # ################################################################################################################ #
+    # getMss()                                                                                                         #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Segment size new data is cut to                                                                                  #
+    # ################################################################################################################ #
+    def getMss(self):
+        if self.mss is not None:
+            return self.mss
+        return min(self.segmentSize, DATA_LENGTH)
+
+    # The segment size offered in the handshake, cut to what fits in one piece on a channel that has a limit
+    def getSegmentOffer(self):
+        if not hasattr(self.sendChannel, 'getMaxSegmentSize'):
+            return self.segmentSize
+        room = self.sendChannel.getMaxSegmentSize() - HEADER_SIZE - MAX_SACK_BLOCKS * SACK_BLOCK.size
+        return max(DATA_LENGTH, min(self.segmentSize, room))
+
+    # ################################################################################################################ #
+    # setForwardErrorCorrection()                                                                                      #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to send an XOR parity segment after every groupSize data segments, and to rebuild a lost segment  #
+    # from its group's parity without a retransmission. With adaptive, groupSize follows the measured loss rate.       #
+    # Both endpoints should use the same setting                                                                       #
+    # ################################################################################################################ #
+    def setForwardErrorCorrection(self, enabled, groupSize=4, adaptive=True):
+        if enabled:
+            self.fecEncoder = ParityEncoder(groupSize, adaptive)
+            self.fecDecoder = ParityDecoder(max(self.segmentSize, DATA_LENGTH))
+        else:
+            self.fecEncoder = None
+            self.fecDecoder = None
+            self.parity_after = {}
+
+    # ################################################################################################################ #
+    # setRetransmissionTimer()                                                                                         #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to replace the RTT estimator and, optionally, its clock (e.g. time.monotonic). The estimator's    #
+    # RTO bounds must be in the clock's unit. Without a clock, timers run in iterations                                #
+    # ################################################################################################################ #
+    def setRetransmissionTimer(self, estimator, clock=None):
+        self.rttEstimator = estimator
+        self.clock = clock
+
+    # ################################################################################################################ #
+    # setMetrics()                                                                                                     #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to time this layer's phases and sample its queues into a metrics registry every iteration, and,   #
+    # with the registry's trace on, record every segment sent, retransmitted and acked. None turns it off again        #
+    # ################################################################################################################ #
+    def setMetrics(self, metrics):
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.addCollector(self.collectMetrics)
+
+    # Copies the layer's own counters into the registry, called when it is exported
+    def collectMetrics(self, metrics):
+        metrics.setCounter('segmentTimeouts', self.countSegmentTimeouts)
+        metrics.setCounter('fastRetransmits', self.countFastRetransmits)
+        metrics.setCounter('retransmissions', self.countRetransmissions)
+        metrics.setCounter('bytesDelivered', self.bytesDelivered())
+        if self.fecEncoder is not None:
+            metrics.setCounter('paritySent', self.fecEncoder.countParity)
+            metrics.setCounter('parityRecovered', self.fecDecoder.countRecovered)
+
+    # Gauges and queue depths, once per iteration
+    def sampleMetrics(self):
+        metrics = self.metrics
+        if self.dataSource is not None:
+            metrics.setGauge('inFlightBytes', self.in_flight_bytes)
+            metrics.setGauge('congestionWindow', self.congestionControl.getWindow())
+            metrics.observe('inFlightSegments', len(self.in_flight))
+            metrics.observe('sendQueueDepth', len(self.send_queue))
+        metrics.observe('outOfOrderSegments', len(self.reassembly.getPending()))
+
+    # ################################################################################################################ #
+    # now()                                                                                                            #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Current time for the retransmission timers                                                                       #
+    # ################################################################################################################ #
+    def now(self):
+        if self.clock is not None:
+            return self.clock()
+        return self.currentIteration
+
+    # ################################################################################################################ #
+    # getSackBlocks()                                                                                                  #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Out-of-order [start, end) ranges buffered above last_proc_byte, lowest first                                     #
+    # ################################################################################################################ #
+    def getSackBlocks(self):
+        return self.reassembly.getBlocks(MAX_SACK_BLOCKS)
+
+    # ################################################################################################################ #
+    # setDataSink()                                                                                                    #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to push received data as soon as it is in order, to a callable or a writable file object,         #
+    # instead of keeping it. A sink with a backlog() method shrinks the advertised window by what it still holds       #
+    # ################################################################################################################ #
+    def setDataSink(self, sink):
+        if hasattr(sink, 'write'):
+            sink = sink.write
+        self.dataSink = sink
+        self.reassembly.setSink(sink)
+
+    # ################################################################################################################ #
+    # setResumable()                                                                                                   #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main, before the transfer starts, to write received data into outputPath and checkpoint the receive    #
+    # state every `every` characters. When a checkpoint is there from an interrupted run, receiving picks up from it   #
+    # and the handshake tells the sender to start at the delivered offset instead of seq 0. Bytes payloads only        #
+    # ################################################################################################################ #
+    def setResumable(self, outputPath, checkpointPath=None, every=CHECKPOINT_INTERVAL):
+        self.checkpoint = ReceiverCheckpoint(outputPath, checkpointPath, every)
+        self.setDataSink(self.checkpoint)
+        self.reassembly.resume(self.checkpoint.delivered)
+        for start, data in self.checkpoint.getRanges():
+            self.reassembly.add(start, data)
+        self.last_proc_byte = self.reassembly.bytesDelivered()
+
+    # ################################################################################################################ #
+    # saveCheckpoint()                                                                                                 #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Checkpoints the resumable receive now. processData() calls it every `every` characters delivered                 #
+    # ################################################################################################################ #
+    def saveCheckpoint(self):
+        logger.info("Connection %d: checkpoint at %d", self.connId, self.last_proc_byte)
+        self.checkpoint.save(self.last_proc_byte, self.reassembly.getPending(), self.reassembly.getRanges())
+
+    # ################################################################################################################ #
+    # closeResumable()                                                                                                 #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main when receiving stops, finished or not. Saves a last checkpoint and closes the output file         #
+    # ################################################################################################################ #
+    def closeResumable(self):
+        self.checkpoint.finish(self.last_proc_byte, self.reassembly.getPending(), self.reassembly.getRanges())
+        self.checkpoint = None
+
+    # ################################################################################################################ #
+    # deliveries()                                                                                                     #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Sets and returns an AsyncDeliveryQueue sink, for `async for data in layer.deliveries()`                          #
+    # ################################################################################################################ #
+    def deliveries(self):
+        queue = AsyncDeliveryQueue()
+        self.setDataSink(queue)
+        return queue
+
+    # ################################################################################################################ #
+    # getReceiveWindow()                                                                                               #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Characters past last_proc_byte this side can take, advertised in every ack                                       #
+    # ################################################################################################################ #
+    def getReceiveWindow(self):
+        backlog = self.dataSink.backlog() if hasattr(self.dataSink, 'backlog') else 0
+        return max(0, self.receiveBufferSize - backlog)
 
     # ################################################################################################################ #
     # getDataReceived()                                                                                                #
     #                                                                                                                  #
     # Description:                                                                                                     #
-    # Called by main to get the currently received and buffered string data, in order  
-    # Sorts received segments and appends the payload in sequence order                                #                                                                                                                 #
+    # Called by main to get the currently received and buffered string data, in order                                  #
     # ################################################################################################################ #
     def getDataReceived(self):
-        result = ''
-        segments = sorted(self.captured_segments, key=lambda s: s.seqnum, reverse=False)
-        for payload in segments:
-            result += payload.payload
-        return result
+        return self.reassembly.getData()
+
+    # ################################################################################################################ #
+    # bytesDelivered()                                                                                                 #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to get how many characters have been received in order, without building the string               #
+    # ################################################################################################################ #
+    def bytesDelivered(self):
+        return self.reassembly.bytesDelivered()
+
+    # ################################################################################################################ #
+    # isSendComplete()                                                                                                 #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to check whether the receiver has acknowledged every character of the data to send                #
+    # ################################################################################################################ #
+    def isSendComplete(self):
+        return self.dataSource is not None and self.dataSource.atEnd(self.highest_ack)
+
+    # ################################################################################################################ #
+    # transmitted()                                                                                                    #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by a send channel that holds segments back (see multiplex.py) when one actually goes out, at `time` in    #
+    # the timers' clock. A data segment's retransmission timer restarts then: time spent queued isn't round trip       #
+    # ################################################################################################################ #
+    def transmitted(self, seg, time):
+        if seg.seqnum == -1 or seg.flags & FLAG_PARITY:
+            return
+        entry = self.in_flight.get(seg.seqnum)
+        if entry is not None:
+            entry[0] = time
+
+    # ################################################################################################################ #
+    # nextTimeout()                                                                                                    #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # When the earliest retransmission or delayed ack timer expires, in the timers' clock, or None when no timer runs. #
+    # An event-driven caller sleeps until then unless a segment arrives first or hasPendingSend() is True              #
+    # ################################################################################################################ #
+    def nextTimeout(self):
+        deadlines = [sent + self.rttEstimator.getRto(timeouts)
+                     for seq, (sent, count, segment, timeouts) in self.in_flight.items()
+                     if seq not in self.retransmit_pending]
+        ackDeadline = self.ackPolicy.deadline()
+        if ackDeadline is not None:
+            deadlines.append(ackDeadline)
+        if self.mss is None and self.syn_sent is not None:
+            deadlines.append(self.syn_sent[0] + self.rttEstimator.getRto(self.syn_sent[1] - 1))
+        return min(deadlines) if deadlines else None
+
+    # ################################################################################################################ #
+    # hasPendingSend()                                                                                                 #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # True when another processData() would send without waiting for an ack or a timer: retransmissions are queued,    #
+    # or new data is waiting and the window has room for it, as after a burst cut short by setMaxBurst()               #
+    # ################################################################################################################ #
+    def hasPendingSend(self):
+        return bool(self.retransmit_heap) or (bool(self.send_queue) and
+                                              self.in_flight_bytes < self.congestionControl.getWindow())
 
     # ################################################################################################################ #
     # processData()                                                                                                    #
@@ -84,9 +441,22 @@ class RDTLayer(object):
     # ################################################################################################################ #
     def processData(self):
         self.currentIteration += 1
-        if len(self.dataToSend) > 0:
+        metrics = self.metrics
+        mark = metrics.clock() if metrics is not None else None
+        # Acks first, so what they free goes out this iteration instead of the next
+        self.processReceive()
+        if metrics is not None:
+            mark = metrics.phase('processReceive', mark)
+        if self.dataSource is not None:
             self.processSend()
-        self.processReceiveAndSendRespond()
+            if metrics is not None:
+                mark = metrics.phase('processSend', mark)
+        self.flushSend()
+        if metrics is not None:
+            metrics.phase('flushSend', mark)
+            self.sampleMetrics()
+        if self.checkpoint is not None and self.checkpoint.isDue(self.last_proc_byte):
+            self.saveCheckpoint()
 
     # ################################################################################################################ #
     # processSend()                                                                                                    #
@@ -96,9 +466,9 @@ class RDTLayer(object):
     # ################################################################################################################ #
     def processSend(self):
         # You should pipeline segments to fit the flow-control window
-        # The flow-control window is the constant RDTLayer.FLOW_CONTROL_WIN_SIZE
-        # The maximum data that you can send in a segment is RDTLayer.DATA_LENGTH
-        # These constants are given in # characters
+        # The flow-control window is the congestion window, capped by the peer's advertised receive window
+        # The maximum data that you can send in a segment is getMss(), agreed in the handshake
+        # These are given in # characters
 
         # Somewhere in here you will be creating data segments to send.
         # The data is just part of the entire string that you are trying to send.
@@ -106,130 +476,442 @@ class RDTLayer(object):
 
         # Helper function
         def send_data(seq, data):
-            segmentSend = Segment()
-            segmentSend.setData(seq,data)
+            segmentSend = self.makeDataSegment(seq, data)
             # Stage the segement in the send queue
             self.send_queue.append(segmentSend)
+            if self.fecEncoder is not None:
+                self.queueParity(seq, self.fecEncoder.add(seq, data))
+
+        # Offer our segment size until the peer answers, resending the offer on the retransmission timer. Data goes
+        # out meanwhile, in DATA_LENGTH segments every peer accepts
+        now = self.now()
+        if self.mss is None:
+            if self.syn_sent is None or now - self.syn_sent[0] >= self.rttEstimator.getRto(self.syn_sent[1] - 1):
+                self.syn_owed = True
+                self.syn_sent = [now, self.syn_sent[1] + 1 if self.syn_sent is not None else 1]
+
+        mss = self.getMss()
+
+        # Segments allowed out this iteration, and data allowed unacknowledged
+        cwnd = self.congestionControl.getWindow()
+        window = max(1, math.floor(cwnd / mss))
+        if self.maxBurst is not None:
+            window = min(window, self.maxBurst)
+
+        # New data must also fit in the receiver's advertised window
+        limit = None
+        if self.peer_window is not None:
+            limit = self.highest_ack + self.peer_window
 
         # If Client has more bytes to send to server
-        if (len(self.dataToSend) > 0) and (self.seq < len(self.dataToSend)):
-            while len(self.send_queue) <= math.floor(FLOW_CONTROL_WIN_SIZE / DATA_LENGTH):
-                data = self.dataToSend[self.seq:self.seq + DATA_LENGTH]
+        if not self.dataSource.atEnd(self.seq):
+            while len(self.send_queue) <= window and not self.dataSource.atEnd(self.seq):
+                # Window full. With nothing outstanding one segment still goes out as a probe, and its timer
+                # keeps probing until the window opens
+                if limit is not None and self.seq + mss > limit and (self.in_flight or self.send_queue):
+                    break
+                data = self.dataSource.read(self.seq, mss)
                 send_data(self.seq, data)
                 self.seq += len(data)
+            # The data ran out part way through a group, close it
+            if self.fecEncoder is not None and self.dataSource.atEnd(self.seq) and self.send_queue:
+                self.queueParity(self.send_queue[-1].seqnum, self.fecEncoder.flush())
+
+        # Retransmit in-flight segments whose timer expired. Each segment backs off its own RTO, by its timeouts only: a
+        # fast retransmit that is lost again must not leave the timer that recovers it at maxRto
+        expired = [seq for seq, (sent, count, segment, timeouts) in self.in_flight.items()
+                   if now - sent >= self.rttEstimator.getRto(timeouts) and seq not in self.retransmit_pending]
+        for seq in expired:
+            self.in_flight[seq][3] += 1
+        if expired:
+            self.countSegmentTimeouts += len(expired)
+            if self.metrics is not None and self.metrics.tracing:
+                self.metrics.event('timeout', {'seqs': expired})
+            if self.highest_ack >= self.recovery_point:
+                self.congestionControl.onTimeout(self.currentIteration)
+                self.recovery_point = self.snd_nxt
+            self.resend(expired)
+
+        # Stay within the congestion window size, retransmissions first. New data only goes out while less than a
+        # window is neither acked nor sacked. Limited transmit (RFC 3042): the first two duplicate acks each let one
+        # more segment out, so a small window still gets the three duplicates fast retransmit needs
+        dups = self.dup_acks.get(self.highest_ack, 0)
+        allowance = min(dups, 2) * mss if dups < RenoCongestionControl.DUP_ACK_THRESHOLD else 0
+        sent = 0
+        while sent < window:
+            if self.retransmit_heap:
+                seq = heapq.heappop(self.retransmit_heap)
+                self.retransmit_pending.discard(seq)
+                entry = self.in_flight.get(seq)
+                # Acknowledged or sacked while it waited
+                if entry is None:
+                    continue
+                # Reuse the segment built for the first transmission
+                entry[0] = now
+                entry[1] += 1
+                segment = entry[2]
+                self.countRetransmissions += 1
+                if self.metrics is not None and self.metrics.tracing:
+                    self.metrics.event('retransmit', {'seq': seq, 'length': len(segment.payload), 'times': entry[1]})
+            elif self.send_queue and self.in_flight_bytes < cwnd + allowance:
+                entry = None
+                segment = self.send_queue.popleft()
+                # First transmission, so in_flight stays ordered by seq
+                self.in_flight[segment.seqnum] = [now, 1, segment, 0]
+                self.in_flight_bytes += len(segment.payload)
+                if self.round_end is None:
+                    self.round_end = segment.seqnum + len(segment.payload)
+                    self.round_delivered = self.delivered
+                self.snd_nxt = segment.seqnum + len(segment.payload)
+                if self.fecEncoder is not None:
+                    self.fecEncoder.onSent(1)
+                if self.metrics is not None and self.metrics.tracing:
+                    self.metrics.event('send', {'seq': segment.seqnum, 'length': len(segment.payload)})
+            else:
+                break
+            sent += 1
+
+            # The channel corrupts and stamps what it is given, so it gets a copy and the clean one stays cached.
+            # It waits in the outbox until flushSend(), so acks owed for this iteration's arrivals can ride on it
+            sendSeg = segment.copy()
+            sendSeg.setStartIteration(self.currentIteration)
+            self.outbox.append(sendSeg)
+
+            # A group's parity follows its last member's first transmission and is never resent. It doesn't count
+            # against the window
+            parity = self.parity_after.pop(segment.seqnum, None) if entry is None else None
+            if parity is not None:
+                parity.setStartIteration(self.currentIteration)
+                self.outbox.append(parity)
 
-        # Once client sends all segments, resend segments without ack
-        elif (len(self.dataToSend) > 0) and (self.seq >= len(self.dataToSend)):
-            for seq in self.waiting_ack:
-                data = self.dataToSend[seq: seq + DATA_LENGTH]
-                send_data(seq, data)
+    # ################################################################################################################ #
+    # makeDataSegment()                                                                                                #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Builds a data segment                                                                                            #
+    # ################################################################################################################ #
+    def makeDataSegment(self, seq, data):
+        segmentSend = PackedSegment()
+        segmentSend.connId = self.connId
+        segmentSend.setData(seq, data)
+        return segmentSend
+
+    # ################################################################################################################ #
+    # queueParity()                                                                                                    #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Builds the parity segment of a group the encoder closed, to be sent after the member at seq                      #
+    # ################################################################################################################ #
+    def queueParity(self, seq, parity):
+        if parity is None:
+            return
+        segmentParity = PackedSegment()
+        segmentParity.connId = self.connId
+        segmentParity.setParity(*parity)
+        self.parity_after[seq] = segmentParity
 
-        # Stay within the flow control window size
-        for seg in range(math.floor(FLOW_CONTROL_WIN_SIZE / DATA_LENGTH)):
-            if len(self.send_queue) > 0:
-                # Pop off the first segment and send it
-                sendSeg = self.send_queue.pop(0)
-                print("Sending segment: ", sendSeg.to_string())
-                self.sendChannel.send(sendSeg)
-                self.waiting_ack.append(sendSeg.seqnum)
+    # ################################################################################################################ #
+    # resend()                                                                                                         #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Schedules in-flight seqs for retransmission ahead of new data. The heap sends the lowest seq first, so a later   #
+    # batch can't starve an older hole                                                                                 #
+    # ################################################################################################################ #
+    def resend(self, seqs):
+        for seq in seqs:
+            if seq in self.in_flight and seq not in self.retransmit_pending:
+                heapq.heappush(self.retransmit_heap, seq)
+                self.retransmit_pending.add(seq)
+                # Parity didn't save it, the encoder counts it as residual loss
+                if self.fecEncoder is not None:
+                    self.fecEncoder.onLost(1)
 
     # ################################################################################################################ #
     # processReceive()                                                                                                 #
     #                                                                                                                  #
     # Description:                                                                                                     #
-    # Manages Segment receive tasks                                                                                    #                                                                                                              #
-    # ################################################################################################################ #
-    def processReceiveAndSendRespond(self):
-
-        # Helper function to seperate client duties from server duties
-        def client_process_recv_ack():
-            # Client handling acknowledgemetns received from the server
-            sorted_incoming = sorted(self.receiveChannel.receive(), key=lambda s: s.seqnum, reverse=False)
-            
-            # Append acknoledgements to received list
-            for seg in sorted_incoming:
-                self.rcvd_ack.append(seg.acknum)
-                # Remove acknowledged segments from list of awaiting acknowledgements
-                if seg.acknum in self.waiting_ack:
-                    # Refrence: https://www.pythonforbeginners.com/basics/list-comprehensions-in-python
-                    self.waiting_ack[:] = [x for x in self.waiting_ack if x > seg.acknum]
-
-            # If acknowledgement was received more than 3 times, resend it
-            freq = {}
-            for item in self.rcvd_ack:
-                freq[item] = self.rcvd_ack.count(item)
-
-            for seq, cnt in freq.items():
-                if cnt >= 3:
-                    data = self.dataToSend[seq: seq + DATA_LENGTH]
-                    # Form and send segment
-                    segmentSend = Segment()
-                    segmentSend.setData(seq,data)
-                    # Place the segment in front of the queue
-                    self.send_queue = [segmentSend] + self.send_queue
-                    self.countSegmentTimeouts += 1
-
-                    # remove resent segment
-                    for item in self.rcvd_ack:
-                        if item == seq:
-                            self.rcvd_ack[:] = [x for x in self.rcvd_ack if x >= item]
-                        
-
-        # Helper function to seperate server duties from client duties
-        def server_process_recv_ack():
-            
-            # Helper function, redundant actions
-            def send_ack(ack):
-                segmentAck = Segment()
-                segmentAck.setAck(ack)
-                print("Sending ack: ", segmentAck.to_string())
-                self.sendChannel.send(segmentAck)
-
-            # Server receiving data
-            # This call returns a list of incoming segments (see Segment class)...
-            listIncomingSegments = sorted(self.receiveChannel.receive(), key=lambda s: s.seqnum, reverse=False)
-
-            if len(listIncomingSegments) > 0:                
-                for segment in range(len(listIncomingSegments)):
-                    # Verify checksum
-                    if listIncomingSegments[segment].checkChecksum():
-
-                        if listIncomingSegments[segment].seqnum == self.last_proc_byte:
-                            # Send ack
-                            send_ack(listIncomingSegments[segment].seqnum + len(listIncomingSegments[segment].payload))
-
-                            # Increment last processed byte variable
-                            self.last_proc_byte += len(listIncomingSegments[segment].payload)
-
-                            # Store received segments
-                            self.captured_segments.append(listIncomingSegments[segment])
-
-                            # Iterate staged segments to increment last_proc_byte up to next highest in-order received seq
-                            # Move segements from staged to captured segments
-                            for item in sorted(self.staged_segments, key=lambda s: s.seqnum, reverse=False):
-                                if item.seqnum == self.last_proc_byte:
-                                    self.captured_segments.append(item)
-                                    self.staged_segments.remove(item)
-                                    self.last_proc_byte += len(item.payload)
-
-                        # Send ack cumulative ack. Append received segement to staged segments list
-                        # when segments are missing or corrupted
-                        elif listIncomingSegments[segment].seqnum > self.last_proc_byte:
-                            send_ack(self.last_proc_byte)
-                            self.staged_segments.append(listIncomingSegments[segment])
-
-                        elif listIncomingSegments[segment].seqnum < self.last_proc_byte:
-                            continue
-
-                    # Send cumulative ack. 
-                    else:
-                        send_ack(self.last_proc_byte)
-
-
-        # Determine server or client mode
-        if (len(self.dataToSend) > 0) and (len(self.receiveChannel.receiveQueue) > 0):
-            client_process_recv_ack()
+    # Manages Segment receive tasks. Any segment may carry an ack for our data, data for us, or both                   #
+    # ################################################################################################################ #
+    def processReceive(self):
+        # This call returns a list of incoming segments (see PackedSegment class)...
+        listIncomingSegments = sorted(self.receiveChannel.receive(), key=lambda s: s.seqnum, reverse=False)
+
+        for segment in listIncomingSegments:
+            isParity = segment.flags & FLAG_PARITY
+            hasData = segment.seqnum != -1 and not isParity
+
+            # Verify checksum. The ack is as untrustworthy as the data
+            if not segment.checkChecksum():
+                if hasData:
+                    # Repeats last_proc_byte, a duplicate ack for the sender
+                    self.receivedData(False)
+                continue
+
+            if segment.flags & FLAG_SYN:
+                self.processSyn(segment)
+                continue
+
+            if segment.flags & FLAG_ACK and self.dataSource is not None:
+                self.processAck(segment)
+
+            if hasData:
+                if self.fecDecoder is not None:
+                    self.fecDecoder.addMember(segment.seqnum, segment.payload)
+                # Cumulative ack, which repeats last_proc_byte when segments are missing or corrupted
+                self.receivedData(self.processDataSegment(segment.seqnum, segment.payload))
+            elif isParity and self.fecDecoder is not None:
+                self.fecDecoder.addParity(segment.seqnum, segment.payload)
+
+        # Rebuild what the parities received so far can, once every segment of this batch is in
+        if self.fecDecoder is not None:
+            recovered = self.fecDecoder.recover(self.last_proc_byte)
+            if recovered:
+                for seq, payload in recovered:
+                    self.processDataSegment(seq, payload)
+                # Acks owed for the hole just filled would reach the sender as duplicates and trigger a fast
+                # retransmit of data the receiver already has. They are owed again with the new ack number, so the
+                # sender still counts duplicates for a hole the parity could not fill
+                stale = len(self.acks_owed)
+                self.acks_owed = deque(owed for owed in self.acks_owed if owed[0] >= self.last_proc_byte)
+                stale -= len(self.acks_owed)
+                for i in range(stale + len(recovered)):
+                    self.receivedData(False)
+
+    # ################################################################################################################ #
+    # processSyn()                                                                                                     #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Handshake. The first offer heard from the peer settles the segment size, the smaller of the two, and gives the   #
+    # peer's receive window before any ack, which also bounds the congestion window. An offer that is not itself an    #
+    # answer is answered, each time it arrives                                                                         #
+    # ################################################################################################################ #
+    def processSyn(self, seg):
+        peerMss, window, resume = seg.getSynOptions()
+        if self.mss is None:
+            self.mss = min(self.getSegmentOffer(), peerMss)
+            self.congestionControl.setMss(self.mss)
+            if self.peer_window is None:
+                self.peer_window = window
+            self.congestionControl.setReceiverWindow(window)
+            logger.info("Connection %d: segment size %d agreed", self.connId, self.mss)
+        if resume > self.highest_ack and self.dataSource is not None:
+            self.skipTo(resume)
+        if not seg.flags & FLAG_SYN_ACK:
+            self.syn_ack_owed = True
+
+    # ################################################################################################################ #
+    # skipTo()                                                                                                         #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # The peer resumed a transfer and already has everything below offset. Forgets what was sent or staged below it    #
+    # and carries on from there, without treating it as newly acknowledged data                                        #
+    # ################################################################################################################ #
+    def skipTo(self, offset):
+        logger.info("Connection %d: the peer has everything below %d, resuming there", self.connId, offset)
+        while self.in_flight:
+            seq = next(iter(self.in_flight))
+            if seq + len(self.in_flight[seq][2].payload) > offset:
+                break
+            self.in_flight_bytes -= len(self.in_flight.popitem(last=False)[1][2].payload)
+        self.send_queue = deque(seg for seg in self.send_queue if seg.seqnum + len(seg.payload) > offset)
+        self.parity_after = dict((seq, parity) for seq, parity in self.parity_after.items() if seq >= offset)
+        if self.seq < offset:
+            # Parity must cover contiguous data, drop the open group
+            if self.fecEncoder is not None:
+                self.fecEncoder.flush()
+            self.seq = offset
+            self.dataSource.skip(offset)
         else:
-            server_process_recv_ack()
+            self.dataSource.release(offset)
+        self.highest_ack = offset
+        self.snd_nxt = max(self.snd_nxt, offset)
+        self.recovery_point = max(self.recovery_point, offset)
+        self.sack_seen = dict((start, end) for start, end in self.sack_seen.items() if end > offset)
+        self.dup_acks = {}
+
+    # ################################################################################################################ #
+    # processAck()                                                                                                     #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Handles the acknowledgement a segment carries for the data this side sends                                       #
+    # ################################################################################################################ #
+    def processAck(self, seg):
+        ack = seg.acknum
+
+        # Only a resumed receiver acks past what was cut so far
+        if ack > self.seq:
+            self.skipTo(ack)
+            self.peer_window = seg.window
+            return
+
+        # Update the scoreboard with the ranges the peer has buffered
+        sack_high = 0
+        if self.selectiveAck:
+            for start, end in seg.sackBlocks:
+                # Blocks are re-reported in every ack, only walk the part not applied yet. Segments may be
+                # short when the source ran dry, so step by the length of the one just removed. After a resume
+                # the blocks needn't line up with our segments: one that runs past the block stays in flight
+                seq = max(start, ack, self.sack_seen.get(start, start))
+                while seq < end:
+                    entry = self.in_flight.get(seq)
+                    if entry is None:
+                        seq += self.getMss()
+                        continue
+                    if seq + len(entry[2].payload) > end:
+                        break
+                    del self.in_flight[seq]
+                    self.in_flight_bytes -= len(entry[2].payload)
+                    self.delivered += len(entry[2].payload)
+                    seq += len(entry[2].payload)
+                self.sack_seen[start] = max(min(seq, end), self.sack_seen.get(start, start))
+                sack_high = max(sack_high, end)
+
+        if ack >= self.highest_ack:
+            self.peer_window = seg.window
+
+        if ack > self.highest_ack:
+            self.congestionControl.onAck(ack - self.highest_ack, self.currentIteration)
+            # Pop the acknowledged prefix. Sample the RTT from the segment this ack completes,
+            # unless it was retransmitted (Karn). After a resume the ack can fall inside a segment, which then
+            # stays in flight whole
+            while self.in_flight:
+                seq = next(iter(self.in_flight))
+                if seq + len(self.in_flight[seq][2].payload) > ack:
+                    break
+                sent, count, segment, timeouts = self.in_flight.popitem(last=False)[1]
+                self.in_flight_bytes -= len(segment.payload)
+                self.delivered += len(segment.payload)
+                if count == 1 and seq + len(segment.payload) >= ack:
+                    sample = self.now() - sent
+                    self.rttEstimator.addSample(sample)
+                    if self.metrics is not None:
+                        self.metrics.observe('rtt', sample, RTT_BUCKETS)
+            self.highest_ack = ack
+            self.sack_seen = dict((start, end) for start, end in self.sack_seen.items() if end > ack)
+            # The receiver has everything below ack, the source can let it go
+            self.dataSource.release(ack)
+            self.dup_acks = {}
+            # A round trip ends when the segment that began it is acked, the next one starts with the next send
+            if self.round_end is not None and ack >= self.round_end:
+                self.congestionControl.onRoundTrip(self.delivered - self.round_delivered)
+                self.round_end = None
+
+        elif ack == self.highest_ack and not self.dataSource.atEnd(ack):
+            count = self.dup_acks.get(ack, 0) + 1
+            self.dup_acks[ack] = count
+            self.congestionControl.onDupAck(count, self.currentIteration)
+
+            # Fast retransmit on every third duplicate
+            if count % 3 == 0:
+                # The segment holding ack, which starts below it when ack falls inside one
+                first = next(iter(self.in_flight), ack)
+                holes = [first]
+                if self.selectiveAck:
+                    # Every unsacked seq below the highest range in this ack is a hole, not just the acked
+                    # one, unless it was (re)sent less than an RTT ago
+                    holes = []
+                    now = self.now()
+                    srtt = self.rttEstimator.srtt or 0
+                    for seq, (sent, times, segment, timeouts) in self.in_flight.items():
+                        if seq >= sack_high:
+                            break
+                        if seq == first or now - sent >= srtt:
+                            holes.append(seq)
+                holes = [seq for seq in holes if seq in self.in_flight and seq not in self.retransmit_pending]
+                self.countFastRetransmits += len(holes)
+                self.resend(holes)
+
+    # ################################################################################################################ #
+    # processDataSegment()                                                                                             #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Stores the payload of a verified or rebuilt data segment. Returns True when it was the next in order and no gap  #
+    # is open, the only case where the ack policy may hold the ack back                                                #
+    # ################################################################################################################ #
+    def processDataSegment(self, seq, payload):
+        # Already delivered segments are only acked again: the sender resends when the acks were lost
+        if seq + len(payload) <= self.last_proc_byte:
+            return False
+
+        # No room for it, the ack tells the sender the current window
+        if seq >= self.last_proc_byte + self.getReceiveWindow():
+            return False
+
+        # In-order data advances last_proc_byte, out-of-order data is buffered until the gap fills
+        delivered = self.reassembly.add(seq, payload)
+        self.last_proc_byte = self.reassembly.bytesDelivered()
+        return delivered == len(payload) and not self.reassembly.hasGaps()
+
+    # ################################################################################################################ #
+    # receivedData()                                                                                                   #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Asks the ack policy whether the data segment just received is acked now or held back                             #
+    # ################################################################################################################ #
+    def receivedData(self, inOrder):
+        if self.ackPolicy.onData(inOrder, self.now()):
+            self.oweAck()
 
+    # ################################################################################################################ #
+    # oweAck()                                                                                                         #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Records an ack for what was received so far. It rides on a data segment sent this iteration, or goes out alone.  #
+    # A coalescing policy replaces an ack already owed this iteration with the same ack number and SACK blocks, unless #
+    # data is held out of order: those duplicate acks are what fast retransmit counts                                  #
+    # ################################################################################################################ #
+    def oweAck(self):
+        ack = (self.last_proc_byte, self.getReceiveWindow(), self.getSackBlocks() if self.selectiveAck else ())
+        if self.ackPolicy.coalesce and self.acks_owed and self.acks_owed[-1][0] == ack[0] \
+                and self.acks_owed[-1][2] == ack[2] and not self.reassembly.hasGaps():
+            self.acks_owed[-1] = ack
+        else:
+            self.acks_owed.append(ack)
+        self.ackPolicy.onAckSent()
 
+    # ################################################################################################################ #
+    # flushSend()                                                                                                      #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Sends a handshake segment if one is owed, then this iteration's data segments, each piggybacking the oldest owed #
+    # ack, then a standalone ack for every owed ack left over. A held-back ack goes out when its timer is due or when  #
+    # it can ride on data for free                                                                                     #
+    # ################################################################################################################ #
+    def flushSend(self):
+        debug = logger.isEnabledFor(logging.DEBUG)
+        tracing = self.metrics is not None and self.metrics.tracing
+
+        # Our segment size offer, or the answer to the peer's, which carries our offer too
+        if self.syn_ack_owed or (self.syn_owed and self.mss is None):
+            segmentSyn = PackedSegment()
+            segmentSyn.connId = self.connId
+            segmentSyn.setSyn(self.getSegmentOffer(), self.getReceiveWindow(), self.last_proc_byte, self.syn_ack_owed)
+            if debug:
+                logger.debug("Sending syn: %s", segmentSyn.to_string())
+            self.sendChannel.send(segmentSyn)
+        self.syn_owed = False
+        self.syn_ack_owed = False
+
+        ackDeadline = self.ackPolicy.deadline()
+        if ackDeadline is not None and (self.now() >= ackDeadline or (self.outbox and not self.acks_owed)):
+            self.oweAck()
+
+        for sendSeg in self.outbox:
+            if self.acks_owed:
+                sendSeg.addAck(*self.acks_owed.popleft())
+                if tracing:
+                    self.metrics.event('ack', {'ack': sendSeg.acknum, 'piggybacked': True})
+            if debug:
+                logger.debug("Sending segment: %s", sendSeg.to_string())
+            self.sendChannel.send(sendSeg)
+        self.outbox = []
+
+        while self.acks_owed:
+            segmentAck = PackedSegment()
+            segmentAck.connId = self.connId
+            segmentAck.setAck(*self.acks_owed.popleft())
+            if tracing:
+                self.metrics.event('ack', {'ack': segmentAck.acknum, 'piggybacked': False})
+            if debug:
+                logger.debug("Sending ack: %s", segmentAck.to_string())
+            self.sendChannel.send(segmentAck)
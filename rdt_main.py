@@ -1,5 +1,8 @@
 from rdt_layer import *
 from unreliable import UnreliableChannel
+from congestion import WestwoodCongestionControl
+from metrics import Metrics, MeteredChannel, writeMetrics, writeChromeTrace
+import logging
 import time
 
 # #################################################################################################################### #
@@ -41,6 +44,13 @@ dataToSend = "\r\n\r\n...We choose to go to the moon. We choose to go to the moo
 
 # #################################################################################################################### #
 
+# Every segment sent is logged at DEBUG. Switch to logging.DEBUG to follow them
+logging.basicConfig(level=logging.WARNING, format='%(message)s')
+
+# Metrics and tracing (see metrics.py): set a path to write them to when the transfer ends
+metricsPath = None          # e.g. 'metrics.json', or 'metrics.prom' for Prometheus text format
+tracePath = None            # e.g. 'trace.json', a Chrome trace for chrome://tracing or https://ui.perfetto.dev
+
 # Create client and server
 client = RDTLayer()
 server = RDTLayer()
@@ -56,6 +66,15 @@ dataErrors = True
 clientToServerChannel = UnreliableChannel(outOfOrder,dropPackets,delayPackets,dataErrors)
 serverToClientChannel = UnreliableChannel(outOfOrder,dropPackets,delayPackets,dataErrors)
 
+registries = []
+if metricsPath or tracePath:
+    registries = [Metrics('client', trace=bool(tracePath)), Metrics('server', trace=bool(tracePath)),
+                  Metrics('clientToServer', trace=bool(tracePath)), Metrics('serverToClient', trace=bool(tracePath))]
+    client.setMetrics(registries[0])
+    server.setMetrics(registries[1])
+    clientToServerChannel = MeteredChannel(clientToServerChannel, registries[2])
+    serverToClientChannel = MeteredChannel(serverToClientChannel, registries[3])
+
 # Creat client and server that connect to unreliable channels
 client.setSendChannel(clientToServerChannel)
 client.setReceiveChannel(serverToClientChannel)
@@ -65,6 +84,14 @@ server.setReceiveChannel(clientToServerChannel)
 # Set initial data that will be sent from client to server
 client.setDataToSend(dataToSend)
 
+# Selective acknowledgements: the server reports buffered ranges so the client only resends the holes
+client.setSelectiveAck(True)
+server.setSelectiveAck(True)
+
+# Grow the client's send window with slow start / AIMD instead of the fixed FLOW_CONTROL_WIN_SIZE pipeline, backing off
+# to the measured delivery rate on a loss rather than halving
+client.setCongestionControl(WestwoodCongestionControl(DATA_LENGTH))
+
 loopIter = 0            # Used to track communication timing in iterations
 while True:
     print("-----------------------------------------------------------------------------------------------------------")
@@ -80,13 +107,17 @@ while True:
     serverToClientChannel.processData()
 
 
-    # show the data received so far
+    # show the progress so far. Building the received string every iteration would make the run quadratic
     print("Main--------------------------------------------")
-    dataReceivedFromClient = server.getDataReceived()
-    print("DataReceivedFromClient: {0}".format(dataReceivedFromClient))
-
-    if dataReceivedFromClient == dataToSend:
-        print('$$$$$$$$ ALL DATA RECEIVED $$$$$$$$')
+    print("DataReceivedFromClient: {0} of {1} characters".format(server.bytesDelivered(), len(dataToSend)))
+
+    if server.bytesDelivered() >= len(dataToSend):
+        dataReceivedFromClient = server.getDataReceived()
+        print("DataReceivedFromClient: {0}".format(dataReceivedFromClient))
+        if dataReceivedFromClient == dataToSend:
+            print('$$$$$$$$ ALL DATA RECEIVED $$$$$$$$')
+        else:
+            print('######## DATA MISMATCH ########')
         break
 
     # time.sleep(0.1)
@@ -102,5 +133,11 @@ print("countAckPackets: {0}".format(serverToClientChannel.countAckPackets))
 print("countDroppedAckPackets: {0}".format(serverToClientChannel.countDroppedPackets))
 
 print("# segment timeouts: {0}".format(client.countSegmentTimeouts))
+print("# fast retransmits: {0}".format(client.countFastRetransmits))
 
 print("TOTAL ITERATIONS: {0}".format(loopIter))
+
+if metricsPath:
+    writeMetrics(metricsPath, registries)
+if tracePath:
+    writeChromeTrace(tracePath, registries)
@@ -0,0 +1,129 @@
+from rdt_layer import RDTLayer, DATA_LENGTH
+from fastchannel import FastUnreliableChannel
+from congestion import RenoCongestionControl, CubicCongestionControl, WestwoodCongestionControl
+from ackpolicy import DelayedAck
+import argparse
+import random
+import sys
+
+# #################################################################################################################### #
+# Modes Main                                                                                                           #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Checks the layer's optional modes over lossy channels. For each mode and seed it sends --size characters lock-step   #
+# like rdt_main.py and checks that they arrive intact, then that the mode did its part: parity rebuilt lost segments   #
+# with fec, and delayed-ack sent fewer acks per data segment than westwood, the engine it runs on, does alone.         #
+#                                                                                                                      #
+#   python rdt_modes.py --modes cubic fec --seeds 10                                                                   #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+MODES = ['reno', 'cubic', 'westwood', 'fec', 'delayed-ack']
+
+
+def makeCongestionControl(mode):
+    if mode == 'reno':
+        return RenoCongestionControl(DATA_LENGTH)
+    if mode == 'cubic':
+        return CubicCongestionControl(DATA_LENGTH)
+    return WestwoodCongestionControl(DATA_LENGTH)
+
+
+# #################################################################################################################### #
+# runMode()                                                                                                            #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# One transfer with the mode set up on both ends. Returns its counters, iterations is None when it stalled             #
+# #################################################################################################################### #
+def runMode(mode, size, mss, window, seed, maxIterations):
+    rng = random.Random(seed)
+    clientToServerChannel = FastUnreliableChannel(True, True, True, True, seed=rng.randrange(2 ** 32))
+    serverToClientChannel = FastUnreliableChannel(True, True, True, True, seed=rng.randrange(2 ** 32))
+    data = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz ') for i in range(size))
+
+    client = RDTLayer()
+    server = RDTLayer()
+    for layer in (client, server):
+        layer.setSelectiveAck(True)
+        layer.setSegmentSize(mss)
+        layer.setReceiveBuffer(window)
+        if mode == 'fec':
+            layer.setForwardErrorCorrection(True)
+    if mode == 'delayed-ack':
+        server.setAckPolicy(DelayedAck())
+    client.setSendChannel(clientToServerChannel)
+    client.setReceiveChannel(serverToClientChannel)
+    server.setSendChannel(serverToClientChannel)
+    server.setReceiveChannel(clientToServerChannel)
+    client.setCongestionControl(makeCongestionControl(mode))
+    client.setDataToSend(data)
+
+    loopIter = 0
+    while server.bytesDelivered() < size or not client.isSendComplete():
+        if loopIter >= maxIterations:
+            loopIter = None
+            break
+        loopIter += 1
+        client.processData()
+        clientToServerChannel.processData()
+        server.processData()
+        serverToClientChannel.processData()
+
+    return {'ok': loopIter is not None and server.getDataReceived() == data, 'iterations': loopIter,
+            'dataPackets': clientToServerChannel.countTotalDataPackets,
+            'ackPackets': serverToClientChannel.countAckPackets,
+            'timeouts': client.countSegmentTimeouts, 'fastRetransmits': client.countFastRetransmits,
+            'recovered': server.fecDecoder.countRecovered if server.fecDecoder is not None else 0}
+
+
+# Acks per data segment sent over a mode's runs
+def ackRatio(results):
+    return sum(r['ackPackets'] for r in results) / max(1, sum(r['dataPackets'] for r in results))
+
+
+def main(args):
+    seeds = range(args.seed, args.seed + args.seeds)
+    runs = {}
+    failures = []
+    for mode in args.modes:
+        runs[mode] = []
+        for seed in seeds:
+            result = runMode(mode, args.size, args.mss, args.window, seed, args.max_iterations)
+            runs[mode].append(result)
+            if not result['ok']:
+                failures.append("{0} seed {1}: data did not arrive intact".format(mode, seed))
+            print("{0} seed {1}: {2} in {3} iterations, {4} data packets, {5} acks, {6} timeouts, {7} fast "
+                  "retransmits, {8} rebuilt from parity".format(
+                      mode, seed, 'OK' if result['ok'] else 'FAILED',
+                      result['iterations'] if result['iterations'] is not None else 'STALLED',
+                      result['dataPackets'], result['ackPackets'], result['timeouts'], result['fastRetransmits'],
+                      result['recovered']))
+
+    if 'fec' in runs and not sum(r['recovered'] for r in runs['fec']):
+        failures.append("fec: parity rebuilt no segments")
+    if 'delayed-ack' in runs:
+        reference = runs.get('westwood') or [runMode('westwood', args.size, args.mss, args.window, seed,
+                                                     args.max_iterations) for seed in seeds]
+        if ackRatio(runs['delayed-ack']) >= ackRatio(reference):
+            failures.append("delayed-ack: {0:.3f} acks per data packet, westwood alone {1:.3f}".format(
+                ackRatio(runs['delayed-ack']), ackRatio(reference)))
+
+    for failure in failures:
+        print(failure)
+    if failures:
+        print('######## {0} MODE CHECKS FAILED ########'.format(len(failures)))
+    else:
+        print('$$$$$$$$ ALL DATA RECEIVED $$$$$$$$')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the congestion, parity and ack modes, checking the output")
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--size', type=int, default=20000)
+    parser.add_argument('--mss', type=int, default=100)
+    parser.add_argument('--window', type=int, default=20000, help="receive buffer each side advertises")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--seeds', type=int, default=4)
+    parser.add_argument('--max-iterations', type=int, default=100000)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,83 @@
+from rdt_layer import *
+from multiplex import Multiplexer
+from fastchannel import FastUnreliableChannel
+from congestion import WestwoodCongestionControl
+import argparse
+import functools
+import random
+import time
+
+# #################################################################################################################### #
+# Multiplexed Main                                                                                                     #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Many client flows to one server over a single unreliable channel pair (see multiplex.py), stepped lock-step like     #
+# rdt_main.py. The server accepts every new connection ID and all flows must arrive intact.                            #
+#                                                                                                                      #
+#   python rdt_mux.py --flows 1000 --size 200                                                                          #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+def makeServerFlow(args, connId):
+    server = RDTLayer()
+    server.setSelectiveAck(True)
+    if args.mss is not None:
+        server.setSegmentSize(args.mss)
+    return server
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    clientToServerChannel = FastUnreliableChannel(True, True, True, True, seed=rng.randrange(2 ** 32))
+    serverToClientChannel = FastUnreliableChannel(True, True, True, True, seed=rng.randrange(2 ** 32))
+    clientMux = Multiplexer(clientToServerChannel, serverToClientChannel, sendBudget=args.budget)
+    serverMux = Multiplexer(serverToClientChannel, clientToServerChannel, accept=functools.partial(makeServerFlow, args))
+
+    dataToSend = {}
+    for connId in range(1, args.flows + 1):
+        data = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz ') for i in range(args.size))
+        dataToSend[connId] = data
+        client = clientMux.openFlow(connId)
+        client.setDataToSend(data)
+        client.setSelectiveAck(True)
+        client.setCongestionControl(WestwoodCongestionControl(DATA_LENGTH))
+        if args.mss is not None:
+            client.setSegmentSize(args.mss)
+
+    start = time.perf_counter()
+    loopIter = 0
+    remaining = set(dataToSend)
+    while remaining:
+        loopIter += 1
+        clientMux.processData()
+        clientToServerChannel.processData()
+        serverMux.processData()
+        serverToClientChannel.processData()
+        for connId in [c for c in remaining if clientMux.getFlow(c).isSendComplete()]:
+            remaining.discard(connId)
+            clientMux.closeFlow(connId)
+    elapsed = time.perf_counter() - start
+
+    mismatched = [connId for connId, data in dataToSend.items()
+                  if serverMux.getFlow(connId).getDataReceived() != data]
+    print("flows: {0}, characters: {1}".format(args.flows, args.flows * args.size))
+    print("countTotalDataPackets: {0}".format(clientToServerChannel.countTotalDataPackets))
+    print("countAckPackets: {0}".format(serverToClientChannel.countAckPackets))
+    print("countUnknownFlowSegments: {0}".format(clientMux.countUnknownFlowSegments))
+    print("seconds: {0:.3f}".format(elapsed))
+    if mismatched:
+        print('######## DATA MISMATCH ######## {0}'.format(mismatched[:10]))
+    else:
+        print('$$$$$$$$ ALL DATA RECEIVED $$$$$$$$')
+    print("TOTAL ITERATIONS: {0}".format(loopIter))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Many RDT flows over one channel pair")
+    parser.add_argument('--flows', type=int, default=100)
+    parser.add_argument('--size', type=int, default=200)
+    parser.add_argument('--budget', type=int, help="segments the client side may send per iteration")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--mss', type=int, help="largest segment each flow offers, in characters")
+    main(parser.parse_args())
@@ -0,0 +1,107 @@
+from rdt_layer import RDTLayer, DATA_LENGTH
+from fastchannel import FastUnreliableChannel
+from congestion import WestwoodCongestionControl
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+# #################################################################################################################### #
+# Resume Main                                                                                                          #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Checks resumable transfers (see resume.py). For each seed it sends --size bytes to a receiver set up with            #
+# setResumable(), stops both ends once --stop of the data is delivered, then starts a fresh sender and receiver that   #
+# pick up from the checkpoint, possibly with another segment size so the resumed segments don't line up with the acks  #
+# and the buffered ranges, and checks the output file against the input.                                               #
+#                                                                                                                      #
+#   python rdt_resume.py --size 200000 --mss 100 --resume-mss 333 --seeds 6                                            #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+# #################################################################################################################### #
+# runLeg()                                                                                                             #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# One run of both ends, lock-step like rdt_main.py, until stopAt characters are delivered or the transfer completes.   #
+# Returns (delivered at the start, delivered at the end, iterations), iterations is None when it stalled               #
+# #################################################################################################################### #
+def runLeg(inputPath, outputPath, size, mss, window, seed, every, stopAt, maxIterations):
+    rng = random.Random(seed)
+    clientToServerChannel = FastUnreliableChannel(True, True, True, True, seed=rng.randrange(2 ** 32))
+    serverToClientChannel = FastUnreliableChannel(True, True, True, True, seed=rng.randrange(2 ** 32))
+    client = RDTLayer()
+    server = RDTLayer()
+    for layer in (client, server):
+        layer.setSelectiveAck(True)
+        layer.setSegmentSize(mss)
+        layer.setReceiveBuffer(window)
+    client.setSendChannel(clientToServerChannel)
+    client.setReceiveChannel(serverToClientChannel)
+    server.setSendChannel(serverToClientChannel)
+    server.setReceiveChannel(clientToServerChannel)
+    client.setCongestionControl(WestwoodCongestionControl(DATA_LENGTH))
+    client.setDataSource(inputPath)
+    server.setResumable(outputPath, every=every)
+
+    start = server.bytesDelivered()
+    loopIter = 0
+    try:
+        while server.bytesDelivered() < size or not client.isSendComplete():
+            if stopAt is not None and server.bytesDelivered() >= stopAt:
+                break
+            if loopIter >= maxIterations:
+                return start, server.bytesDelivered(), None
+            loopIter += 1
+            client.processData()
+            clientToServerChannel.processData()
+            server.processData()
+            serverToClientChannel.processData()
+    finally:
+        server.closeResumable()
+    return start, server.bytesDelivered(), loopIter
+
+
+def main(args):
+    failures = 0
+    with tempfile.TemporaryDirectory() as scratch:
+        inputPath = os.path.join(scratch, 'input.bin')
+        outputPath = os.path.join(scratch, 'output.bin')
+        with open(inputPath, 'wb') as f:
+            f.write(os.urandom(args.size))
+        for seed in range(args.seed, args.seed + args.seeds):
+            for path in (outputPath, outputPath + '.checkpoint'):
+                if os.path.exists(path):
+                    os.remove(path)
+            legs = [(args.mss, int(args.size * args.stop)), (args.resume_mss or args.mss, None)]
+            results = []
+            for leg, (mss, stopAt) in enumerate(legs):
+                results.append(runLeg(inputPath, outputPath, args.size, mss, args.window, seed * 2 + leg,
+                                      args.every, stopAt, args.max_iterations))
+            with open(inputPath, 'rb') as a, open(outputPath, 'rb') as b:
+                ok = a.read() == b.read() and all(iterations is not None for start, end, iterations in results)
+            failures += not ok
+            print("seed {0}: {1}, {2}".format(seed, 'OK' if ok else 'FAILED', ", ".join(
+                "{0} -> {1} in {2} iterations".format(start, end, iterations if iterations is not None else 'STALLED')
+                for start, end, iterations in results)))
+    if failures:
+        print('######## {0} OF {1} RESUMES FAILED ########'.format(failures, args.seeds))
+    else:
+        print('$$$$$$$$ ALL DATA RECEIVED $$$$$$$$')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Interrupt and resume transfers, checking the output")
+    parser.add_argument('--size', type=int, default=200000)
+    parser.add_argument('--mss', type=int, default=100, help="segment size before the interruption")
+    parser.add_argument('--resume-mss', type=int, default=333, help="segment size after it, --mss without one")
+    parser.add_argument('--window', type=int, default=20000, help="receive buffer each side advertises")
+    parser.add_argument('--stop', type=float, default=0.45, help="share of the data delivered before stopping")
+    parser.add_argument('--every', type=int, default=10000, help="characters between checkpoints")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--seeds', type=int, default=6)
+    parser.add_argument('--max-iterations', type=int, default=100000)
+    sys.exit(main(parser.parse_args()))
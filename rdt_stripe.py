@@ -0,0 +1,60 @@
+from stripe import StripeOptions, stripedTransfer
+import argparse
+import filecmp
+import os
+import tempfile
+import time
+
+# #################################################################################################################### #
+# Striped Main                                                                                                         #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Sends a file (or --size generated bytes) as --stripes independent RDT sub-streams on a pool of worker processes (see #
+# stripe.py), checks that the output matches the input and reports the aggregate throughput.                           #
+#                                                                                                                      #
+#   python rdt_stripe.py --size 2000000 --stripes 8 --mss 1000 --emulate                                               #
+#   python rdt_stripe.py some.file --out received.bin --stripes 4                                                      #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as scratch:
+        inputPath = args.file
+        if inputPath is None:
+            inputPath = os.path.join(scratch, 'input.bin')
+            with open(inputPath, 'wb') as f:
+                f.write(os.urandom(args.size))
+        outputPath = args.out or os.path.join(scratch, 'output.bin')
+
+        options = StripeOptions(args.mss, args.window, args.emulate, args.seed)
+        start = time.perf_counter()
+        results = stripedTransfer(inputPath, outputPath, args.stripes, args.workers, options)
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(inputPath)
+
+        for i, result in enumerate(results):
+            print("stripe {0}: {1} bytes at {2}, {3} iterations, {4:.3f}s, {5} timeouts"
+                  .format(i, result['bytes'], result['offset'], result['iterations'], result['seconds'],
+                          result['timeouts']))
+        print("countTotalDataPackets: {0}".format(sum(result['dataPackets'] for result in results)))
+        print("countAckPackets: {0}".format(sum(result['ackPackets'] for result in results)))
+        print("{0} bytes in {1:.3f}s, {2:.0f} bytes/s".format(size, elapsed, size / elapsed if elapsed else 0.0))
+        if filecmp.cmp(inputPath, outputPath, shallow=False):
+            print('$$$$$$$$ ALL DATA RECEIVED $$$$$$$$')
+        else:
+            print('######## DATA MISMATCH ########')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="One transfer striped over worker processes")
+    parser.add_argument('file', nargs='?', help="file to send, --size generated bytes without one")
+    parser.add_argument('--out', help="file to write the received data to")
+    parser.add_argument('--size', type=int, default=1000000)
+    parser.add_argument('--stripes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--workers', type=int, help="worker processes, os.cpu_count() by default")
+    parser.add_argument('--mss', type=int, help="largest segment each side offers, in bytes")
+    parser.add_argument('--window', type=int, help="receive buffer each side advertises, in bytes")
+    parser.add_argument('--emulate', action='store_true', help="drop/delay/corrupt/reorder at the channel ratios")
+    parser.add_argument('--seed', type=int)
+    main(parser.parse_args())
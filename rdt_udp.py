@@ -0,0 +1,223 @@
+from rdt_layer import *
+from udpchannel import UdpChannel
+from congestion import WestwoodCongestionControl
+from rtt import RttEstimator
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+# #################################################################################################################### #
+# UDP Main                                                                                                             #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Runs the client and the server over real UDP sockets (see udpchannel.py) in separate processes and reports the       #
+# wall-clock throughput and round-trip time, instead of rdt_main.py's lock-step iteration count.                       #
+#                                                                                                                      #
+#   python rdt_udp.py server --bind 127.0.0.1:9000 --out received.bin                                                  #
+#   python rdt_udp.py client some.file --server 127.0.0.1:9000 --emulate                                               #
+#   python rdt_udp.py local --size 200000 --emulate       (server in a child process, client in this one)              #
+#   python rdt_udp.py local --size 2000000 --mss 1400 --window 1000000                                                 #
+#   python rdt_udp.py server --out received.bin --resume    (run again after an interruption to pick up where it was)  #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# Timers run on time.monotonic(). The layers log every segment only with --verbose, it would otherwise dominate the    #
+# measurement. The client's RTO backs off to at most half of --idle, so the server hears from a live client before it  #
+# gives up; give the client the server's --idle. A client whose data goes unacknowledged for --idle plus that long     #
+# gives up too, and the command exits with status 1.                                                                   #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+POLL_INTERVAL = 0.001       # seconds to wait for a datagram when a loop iteration received nothing
+IDLE_TIMEOUT = 5.0          # seconds without a datagram before the server decides the transfer is over
+MAX_BURST = 32              # segments the client sends per iteration, the server works through one while it sends more
+
+
+def parseAddress(text):
+    host, port = text.rsplit(':', 1)
+    return host, int(port)
+
+
+def makeChannel(args, localAddress, remoteAddress=None):
+    emulate = args.emulate
+    return UdpChannel(localAddress, remoteAddress, emulate, emulate, emulate, emulate, seed=args.seed)
+
+
+# Segment size and receive buffer from the command line, the layer's defaults without them
+def configure(layer, args):
+    if args.mss is not None:
+        layer.setSegmentSize(args.mss)
+    if args.window is not None:
+        layer.setReceiveBuffer(args.window)
+
+
+# Per-segment logging for --verbose. Each process sets it up for itself
+def configureLogging(args):
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG, format='%(processName)s %(message)s')
+
+
+# #################################################################################################################### #
+# runServer()                                                                                                          #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Receives until the client has been silent for args.idle seconds. With `ready`, a multiprocessing queue, the bound    #
+# address is put on it before receiving and the results after                                                          #
+# #################################################################################################################### #
+def runServer(args, ready=None):
+    configureLogging(args)
+    channel = makeChannel(args, parseAddress(args.bind))
+    if ready is not None:
+        ready.put(channel.getAddress())
+
+    server = RDTLayer()
+    server.setSendChannel(channel)
+    server.setReceiveChannel(channel)
+    server.setSelectiveAck(True)
+    configure(server, args)
+    if args.resume:
+        out = None
+        server.setResumable(args.out)
+    else:
+        out = open(args.out, 'wb') if args.out else open(os.devnull, 'wb')
+        server.setDataSink(out)
+
+    first = last = None
+    try:
+        while True:
+            server.processData()
+            channel.processData()
+            delivered = server.bytesDelivered()
+            if channel.receiveQueue or channel.wait(POLL_INTERVAL):
+                if first is None:
+                    first = time.monotonic()
+                last = time.monotonic()
+            elif first is not None and time.monotonic() - last >= args.idle:
+                break
+    finally:
+        # Interrupted or not, a resumable server leaves a checkpoint to pick up from
+        if out is None:
+            server.closeResumable()
+        else:
+            out.close()
+    channel.close()
+
+    results = {'bytes': delivered, 'seconds': (last - first) if first is not None else 0.0,
+               'acks': channel.countAckPackets, 'datagramsReceived': channel.countDatagramsReceived}
+    if ready is not None:
+        ready.put(results)
+    else:
+        report('server', results)
+    return results
+
+
+# #################################################################################################################### #
+# runClient()                                                                                                          #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Sends the file (or args.size generated bytes) to the server and returns once every byte is acknowledged              #
+# #################################################################################################################### #
+def runClient(args, serverAddress):
+    configureLogging(args)
+    channel = makeChannel(args, ('0.0.0.0', 0), serverAddress)
+    client = RDTLayer()
+    client.setSendChannel(channel)
+    client.setReceiveChannel(channel)
+    client.setSelectiveAck(True)
+    client.setCongestionControl(WestwoodCongestionControl(DATA_LENGTH))
+    client.setMaxBurst(MAX_BURST)
+    configure(client, args)
+    maxRto = args.idle / 2
+    client.setRetransmissionTimer(RttEstimator(initialRto=min(1.0, maxRto), minRto=min(0.2, maxRto), maxRto=maxRto,
+                                               granularity=0.001), time.monotonic)
+    if args.file:
+        size = os.path.getsize(args.file)
+        client.setDataSource(args.file)
+    else:
+        size = args.size
+        client.setDataSource([os.urandom(size)])
+
+    # The server has gone once nothing is acked for longer than it waits plus a backed-off retransmission
+    stallTimeout = args.idle + maxRto
+    start = progress = time.monotonic()
+    acked = 0
+    iterations = 0
+    complete = True
+    while not client.isSendComplete():
+        iterations += 1
+        client.processData()
+        channel.processData()
+        if not channel.receiveQueue:
+            channel.wait(POLL_INTERVAL)
+            channel.drain()
+        if client.highest_ack > acked:
+            acked = client.highest_ack
+            progress = time.monotonic()
+        elif time.monotonic() - progress > stallTimeout:
+            complete = False
+            break
+    elapsed = time.monotonic() - start
+    channel.close()
+
+    results = {'bytes': size, 'complete': complete, 'acked': acked, 'seconds': elapsed, 'iterations': iterations,
+               'throughput': size / elapsed if elapsed else 0.0,
+               'srtt': client.rttEstimator.srtt, 'rto': client.rttEstimator.rto,
+               'dataPackets': channel.countTotalDataPackets, 'datagramsSent': channel.countDatagramsSent,
+               'timeouts': client.countSegmentTimeouts, 'fastRetransmits': client.countFastRetransmits,
+               'emulatedDrops': channel.countDroppedPackets, 'emulatedErrors': channel.countChecksumErrorPackets}
+    report('client', results)
+    if not complete:
+        print("######## GAVE UP: nothing acknowledged for {0:.1f}s ########".format(stallTimeout))
+    return results
+
+
+def report(name, results):
+    print("{0}:".format(name))
+    for key, value in results.items():
+        if isinstance(value, float):
+            value = "{0:.6f}".format(value)
+        print("  {0}: {1}".format(key, value))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reliable transfer over UDP between processes")
+    parser.add_argument('mode', choices=('server', 'client', 'local'))
+    parser.add_argument('file', nargs='?', help="file for the client to send, --size generated bytes without one")
+    parser.add_argument('--bind', default='127.0.0.1:9000', help="server address to listen on")
+    parser.add_argument('--server', default='127.0.0.1:9000', help="server address for the client")
+    parser.add_argument('--out', help="file the server writes the received data to")
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--idle', type=float, default=IDLE_TIMEOUT,
+                        help="seconds the server waits for a datagram before it stops, give the client the same")
+    parser.add_argument('--emulate', action='store_true', help="drop/delay/corrupt/reorder at the channel ratios")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--mss', type=int,
+                        help="largest segment each side offers, in bytes, cut to what fits a datagram")
+    parser.add_argument('--window', type=int, help="receive buffer each side advertises, in bytes")
+    parser.add_argument('--resume', action='store_true',
+                        help="checkpoint --out as it is received and resume from its checkpoint when there is one")
+    parser.add_argument('--verbose', action='store_true', help="log every segment sent")
+    args = parser.parse_args(argv)
+    if args.resume and not args.out:
+        parser.error("--resume needs --out")
+
+    if args.mode == 'server':
+        runServer(args)
+        return 0
+    if args.mode == 'client':
+        results = runClient(args, parseAddress(args.server))
+    else:
+        args.bind = '127.0.0.1:0'
+        ready = multiprocessing.Queue()
+        process = multiprocessing.Process(target=runServer, args=(args, ready))
+        process.start()
+        results = runClient(args, ready.get())
+        report('server', ready.get())
+        process.join()
+    return 0 if results['complete'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import bisect
+import io
+
+
+# #################################################################################################################### #
+# ReassemblyBuffer                                                                                                     #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Receive-side reassembly. In-order data is appended to a contiguous delivered buffer; out-of-order segments wait in   #
+# a dict keyed by seq, with a sorted interval map of the buffered [start, end) ranges for SACK reporting.              #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# Segments may overlap what is already buffered, e.g. when a resumed sender cuts them at new boundaries. Only the      #
+# parts not buffered yet are kept, so the pending pieces never overlap.                                                #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+class ReassemblyBuffer(object):
+    def __init__(self):
+        self.delivered = None       # Delivered data, a StringIO or a BytesIO by the first payload's type
+        self.joined = None          # Cached getData() result, None once more data was delivered
+        self.length = 0             # Characters delivered in order, also the next seq expected
+        self.pending = {}           # Out-of-order seq -> payload
+        self.starts = []            # Sorted starts of the buffered out-of-order ranges
+        self.ends = []              # Matching ends
+        self.lastSeq = None         # Most recent out-of-order seq, its range is reported first
+        self.sink = None            # Called with each newly contiguous run of data instead of keeping it
+
+    # ################################################################################################################ #
+    # add()                                                                                                            #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Stores a verified segment. Returns the number of characters newly delivered in order                             #
+    # ################################################################################################################ #
+    def add(self, seq, payload):
+        end = seq + len(payload)
+        if end <= self.length:
+            return 0
+        if seq < self.length:
+            # Overlaps what was already delivered, keep only the new tail
+            payload = payload[self.length - seq:]
+            seq = self.length
+
+        # Overlaps buffered ranges, keep only the gaps between them
+        i = bisect.bisect_right(self.starts, seq) - 1
+        if (i >= 0 and self.ends[i] > seq) or (i + 1 < len(self.starts) and self.starts[i + 1] < end):
+            gaps = self.uncovered(seq, end, max(i, 0))
+            if not gaps:
+                return 0
+            for start, stop in gaps:
+                self.pending[start] = payload[start - seq:stop - seq]
+            if seq > self.length:
+                self.addInterval(seq, end)
+                self.lastSeq = seq
+                return 0
+            before = self.length
+            pieces = []
+        elif seq > self.length:
+            self.pending[seq] = payload
+            self.addInterval(seq, end)
+            self.lastSeq = seq
+            return 0
+        else:
+            before = self.length
+            pieces = [payload]
+            self.length += len(payload)
+
+        while self.length in self.pending:
+            pieces.append(self.pending.pop(self.length))
+            self.length += len(pieces[-1])
+        self.deliver(pieces)
+
+        # Forget the ranges that are now delivered
+        while self.starts and self.ends[0] <= self.length:
+            self.starts.pop(0)
+            self.ends.pop(0)
+        if self.starts and self.starts[0] < self.length:
+            self.starts[0] = self.length
+        return self.length - before
+
+    # Parts of [start, end) outside the buffered ranges, looking from range i on
+    def uncovered(self, start, end, i):
+        gaps = []
+        while start < end and i < len(self.starts) and self.starts[i] < end:
+            if self.starts[i] > start:
+                gaps.append((start, self.starts[i]))
+            start = max(start, self.ends[i])
+            i += 1
+        if start < end:
+            gaps.append((start, end))
+        return gaps
+
+    # ################################################################################################################ #
+    # resume()                                                                                                         #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Starts an empty buffer at offset, for a receiver whose first offset characters were delivered before a restart   #
+    # ################################################################################################################ #
+    def resume(self, offset):
+        self.length = offset
+
+    def deliver(self, pieces):
+        if self.sink is None:
+            # Appending costs only the new data, however much was delivered before
+            if self.delivered is None:
+                self.delivered = io.StringIO() if isinstance(pieces[0], str) else io.BytesIO()
+            for piece in pieces:
+                self.delivered.write(piece)
+            self.joined = None
+        else:
+            # One call per advance. Joining also copies the data out of the sender's buffers
+            joiner = '' if isinstance(pieces[0], str) else b''
+            self.sink(joiner.join(pieces))
+
+    # ################################################################################################################ #
+    # setSink()                                                                                                        #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Hands every newly contiguous run of data to sink(data) and forgets it. getData() then stays empty                #
+    # ################################################################################################################ #
+    def setSink(self, sink):
+        self.sink = sink
+
+    def addInterval(self, start, end):
+        i = bisect.bisect_left(self.starts, start)
+        # Merge with the previous range if they touch
+        if i > 0 and self.ends[i - 1] >= start:
+            i -= 1
+            start = self.starts[i]
+            end = max(end, self.ends[i])
+            del self.starts[i]
+            del self.ends[i]
+        # Absorb following ranges that now touch
+        while i < len(self.starts) and self.starts[i] <= end:
+            end = max(end, self.ends[i])
+            del self.starts[i]
+            del self.ends[i]
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+
+    # ################################################################################################################ #
+    # getData()                                                                                                        #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Everything delivered so far. Building it copies all n characters, O(n), so the result is cached until more       #
+    # data is delivered. Call it once the transfer is done, not every iteration                                        #
+    # ################################################################################################################ #
+    def getData(self):
+        if self.delivered is None:
+            return ''
+        if self.joined is None:
+            self.joined = self.delivered.getvalue()
+        return self.joined
+
+    def bytesDelivered(self):
+        return self.length
+
+    # Out-of-order seq -> payload pieces, which never overlap
+    def getPending(self):
+        return self.pending
+
+    # Every buffered out-of-order (start, end) range, lowest first
+    def getRanges(self):
+        return list(zip(self.starts, self.ends))
+
+    # True while out-of-order data waits for a gap to fill
+    def hasGaps(self):
+        return bool(self.pending)
+
+    # Up to `limit` buffered out-of-order ranges as (start, end) tuples. The range holding the most recent arrival
+    # comes first (RFC 2018), so over several acks the sender learns about every range, then the lowest ones
+    def getBlocks(self, limit):
+        blocks = list(zip(self.starts[:limit], self.ends[:limit]))
+        if self.lastSeq is not None and self.starts:
+            i = bisect.bisect_right(self.starts, self.lastSeq) - 1
+            if i >= 0 and self.lastSeq < self.ends[i]:
+                recent = (self.starts[i], self.ends[i])
+                blocks = [recent] + [b for b in blocks if b != recent][:limit - 1]
+        return blocks
@@ -0,0 +1,81 @@
+from sink import MmapSink
+import json
+import os
+
+
+# #################################################################################################################### #
+# ReceiverCheckpoint                                                                                                   #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Receive side of a resumable transfer. Delivered data goes straight into a memory-mapped output file, and every       #
+# `every` characters the out-of-order segments are written at their offsets too, the map is flushed and the delivered  #
+# offset and buffered ranges are saved to a small JSON checkpoint file. After a restart the receiver picks up from the #
+# checkpoint and tells the sender, in the handshake, where to start (see RDTLayer.setResumable()).                     #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# The checkpoint only ever describes data already flushed to the output file, and it is replaced atomically, so an     #
+# interruption at any point leaves a usable checkpoint. Both ends restart to resume, the sender from its full data.    #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+CHECKPOINT_INTERVAL = 1024 * 1024   # characters delivered between checkpoints
+
+
+class ReceiverCheckpoint(MmapSink):
+    def __init__(self, outputPath, checkpointPath=None, every=CHECKPOINT_INTERVAL):
+        self.checkpointPath = checkpointPath or outputPath + '.checkpoint'
+        self.every = every
+        state = self.load() if os.path.exists(outputPath) else None
+        if state is None:
+            open(outputPath, 'wb').close()
+            state = {'delivered': 0, 'ranges': []}
+        self.delivered = state['delivered']
+        self.ranges = [tuple(r) for r in state['ranges']]
+        super().__init__(outputPath, self.delivered)
+        self.saved = self.delivered
+        self.size = max([self.delivered] + [end for start, end in self.ranges])  # Bytes of the file in use
+
+    def load(self):
+        try:
+            with open(self.checkpointPath) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    # Out-of-order data the last checkpoint saved, as (start, bytes) to re-buffer
+    def getRanges(self):
+        return [(start, bytes(self.map[start:end])) for start, end in self.ranges]
+
+    def writeAt(self, offset, data):
+        super().writeAt(offset, data)
+        self.size = max(self.size, offset + len(data))
+
+    def isDue(self, delivered):
+        return delivered - self.saved >= self.every
+
+    # ################################################################################################################ #
+    # save()                                                                                                           #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Writes the buffered out-of-order pieces ({seq: payload}) at their offsets, flushes the file, then records the    #
+    # delivered offset and the buffered ranges                                                                         #
+    # ################################################################################################################ #
+    def save(self, delivered, pieces, ranges):
+        for seq, payload in pieces.items():
+            self.writeAt(seq, payload)
+        self.map.flush()
+        state = {'delivered': delivered, 'ranges': [list(r) for r in ranges]}
+        temporary = self.checkpointPath + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.checkpointPath)
+        self.saved = delivered
+
+    # Saves a last checkpoint and cuts the output file to the data it holds
+    def finish(self, delivered, pieces, ranges):
+        self.save(delivered, pieces, ranges)
+        self.map.close()
+        self.file.truncate(self.size)
+        self.file.close()
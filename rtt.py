@@ -0,0 +1,42 @@
+# #################################################################################################################### #
+# RttEstimator                                                                                                         #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Smoothed round-trip time and retransmission timeout (RTO) estimation, Jacobson/Karels style (RFC 6298).              #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# The estimator has no clock of its own. Samples and timeouts are in whatever unit the owner's clock uses, which is    #
+# RDTLayer iterations by default. Pass wall-clock values (seconds) for initialRto/minRto/maxRto/granularity when the   #
+# layer runs on time.monotonic().                                                                                      #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+class RttEstimator(object):
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+
+    def __init__(self, initialRto=3, minRto=2, maxRto=60, granularity=1):
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initialRto
+        self.minRto = minRto
+        self.maxRto = maxRto
+        self.granularity = granularity
+
+    # Feed one round-trip measurement. Never call this for a retransmitted segment (Karn's algorithm)
+    def addSample(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - RttEstimator.BETA) * self.rttvar + RttEstimator.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - RttEstimator.ALPHA) * self.srtt + RttEstimator.ALPHA * rtt
+        rto = self.srtt + max(self.granularity, RttEstimator.K * self.rttvar)
+        self.rto = min(max(rto, self.minRto), self.maxRto)
+
+    # Timeout for a segment that already timed out `backoff` times, doubling each time (exponential backoff)
+    def getRto(self, backoff=0):
+        return min(self.rto * 2 ** min(backoff, 16), self.maxRto)
@@ -0,0 +1,84 @@
+import asyncio
+import mmap
+import os
+from collections import deque
+
+
+# #################################################################################################################### #
+# AsyncDeliveryQueue                                                                                                   #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Delivery sink for a receiving RDTLayer that is consumed with `async for data in queue`. Chunks wait here until the   #
+# consumer takes them, and backlog() reports how much is waiting so the layer can shrink its advertised window.        #
+#                                                                                                                      #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+class AsyncDeliveryQueue(object):
+    def __init__(self):
+        self.chunks = deque()
+        self.backlogBytes = 0
+        self.closed = False
+        self.ready = asyncio.Event()
+
+    # Called by the layer with each contiguous run of data
+    def __call__(self, data):
+        self.chunks.append(data)
+        self.backlogBytes += len(data)
+        self.ready.set()
+
+    def backlog(self):
+        return self.backlogBytes
+
+    # No more data will come, the consumer's loop ends once the queue is drained
+    def close(self):
+        self.closed = True
+        self.ready.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self.chunks:
+            if self.closed:
+                raise StopAsyncIteration
+            self.ready.clear()
+            await self.ready.wait()
+        data = self.chunks.popleft()
+        self.backlogBytes -= len(data)
+        return data
+
+
+# #################################################################################################################### #
+# MmapSink                                                                                                             #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Delivery sink that writes each contiguous run of data straight into a memory-mapped file, starting at offset. The    #
+# file grows when data runs past its end. Several sinks, in several processes, can fill disjoint ranges of one file    #
+# sized beforehand.                                                                                                    #
+# #################################################################################################################### #
+class MmapSink(object):
+    def __init__(self, path, offset=0):
+        self.file = open(path, 'r+b')
+        # An empty file can't be mapped
+        if os.fstat(self.file.fileno()).st_size == 0:
+            self.file.truncate(mmap.PAGESIZE)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.position = offset
+
+    def __call__(self, data):
+        self.writeAt(self.position, data)
+        self.position += len(data)
+
+    def writeAt(self, offset, data):
+        end = offset + len(data)
+        if end > len(self.map):
+            # Grow geometrically, the file is cut to size by whoever knows it
+            self.map.resize(max(end, 2 * len(self.map)))
+        self.map[offset:end] = data
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+        self.file.close()
@@ -0,0 +1,165 @@
+import bisect
+import os
+
+
+# #################################################################################################################### #
+# Data Sources                                                                                                         #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Where an RDTLayer cuts its data segments from. read(seq, length) returns the payload for a span, release(upto) tells #
+# the source the receiver has everything below upto, and atEnd(seq) is True once seq is past the last character.       #
+# skip(offset) is release(offset) for a resumed transfer, whose receiver already has everything below offset.          #
+#                                                                                                                      #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+# #################################################################################################################### #
+# StringSource                                                                                                         #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# The whole string given to setDataToSend(), sliced per segment.                                                       #
+# #################################################################################################################### #
+class StringSource(object):
+    def __init__(self, data):
+        self.data = data
+
+    def read(self, seq, length):
+        return self.data[seq:seq + length]
+
+    def atEnd(self, seq):
+        return seq >= len(self.data)
+
+    def release(self, upto):
+        pass
+
+    def skip(self, offset):
+        pass
+
+
+# #################################################################################################################### #
+# StreamSource                                                                                                         #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Bytes pulled on demand from a file path, a binary file object or an iterator of bytes chunks. Only the chunks that   #
+# are not yet acknowledged are kept, so memory is bounded by the unacknowledged window (rounded up to whole chunks).   #
+# Payloads are memoryview slices of the chunks; only a span that crosses a chunk boundary is copied.                   #
+# #################################################################################################################### #
+class StreamSource(object):
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, source):
+        self.file = None
+        self.seekable = None        # File to seek() past data a resumed transfer skips, None to read through it
+        if isinstance(source, (str, os.PathLike)):
+            self.file = open(source, 'rb')
+            self.seekable = self.file
+            self.chunkIter = iter(lambda: self.file.read(StreamSource.CHUNK_SIZE), b'')
+        elif hasattr(source, 'read'):
+            if hasattr(source, 'seekable') and source.seekable():
+                self.seekable = source
+            self.chunkIter = iter(lambda: source.read(StreamSource.CHUNK_SIZE), b'')
+        else:
+            self.chunkIter = iter(source)
+        self.chunks = []            # memoryviews of buffered chunks, from index head on
+        self.starts = []            # Offset of each chunk
+        self.head = 0               # First chunk not yet released
+        self.end = 0                # Offset just past the last buffered chunk
+        self.eof = False
+
+    # Pull chunks until `upto` is buffered or the source runs out
+    def fill(self, upto):
+        while self.end < upto and not self.eof:
+            chunk = next(self.chunkIter, None)
+            if chunk is None:
+                self.eof = True
+                self.close()
+                break
+            self.addChunk(chunk)
+
+    def addChunk(self, chunk):
+        if isinstance(chunk, str):
+            raise TypeError("data source must yield bytes, not str")
+        if not chunk:
+            return
+        if not isinstance(chunk, bytes):
+            # Mutable buffers (bytearray, ...) could change under an in-flight payload
+            chunk = bytes(chunk)
+        self.chunks.append(memoryview(chunk))
+        self.starts.append(self.end)
+        self.end += len(chunk)
+
+    def read(self, seq, length):
+        self.fill(seq + length)
+        i = bisect.bisect_right(self.starts, seq, self.head) - 1
+        if i < self.head:
+            raise ValueError("seq {0} was already released".format(seq))
+        offset = seq - self.starts[i]
+        payload = self.chunks[i][offset:offset + length]
+        if len(payload) == length or i + 1 >= len(self.chunks):
+            return payload
+
+        # The span crosses into the following chunks
+        pieces = [payload]
+        needed = length - len(payload)
+        for chunk in self.chunks[i + 1:]:
+            pieces.append(chunk[:needed])
+            needed -= len(pieces[-1])
+            if needed <= 0:
+                break
+        return b''.join(pieces)
+
+    def atEnd(self, seq):
+        self.fill(seq + 1)
+        return self.eof and seq >= self.end
+
+    def release(self, upto):
+        while self.head < len(self.chunks) and self.starts[self.head] + len(self.chunks[self.head]) <= upto:
+            self.chunks[self.head] = None
+            self.head += 1
+        # Compact once most of the lists are released
+        if self.head > 64 and self.head * 2 > len(self.chunks):
+            del self.chunks[:self.head]
+            del self.starts[:self.head]
+            self.head = 0
+
+    # Seeks past offset when nothing at or beyond it was read yet, otherwise reads up to it and lets it go
+    def skip(self, offset):
+        if self.seekable is not None and offset > self.end and not self.eof:
+            # seek() is relative to where the source was when it was handed over
+            self.seekable.seek(offset - self.end, os.SEEK_CUR)
+            self.chunks = []
+            self.starts = []
+            self.head = 0
+            self.end = offset
+            return
+        self.fill(offset)
+        self.release(offset)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+# #################################################################################################################### #
+# AppendSource                                                                                                         #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Bytes the application hands over with append() while the transfer runs, see connection.py. atEnd(seq) means nothing  #
+# past seq has been appended yet, so the layer sends what is buffered (the last segment may be short) and picks up     #
+# again when more arrives.                                                                                             #
+# #################################################################################################################### #
+class AppendSource(StreamSource):
+    def __init__(self):
+        super().__init__(())
+        self.eof = True
+
+    def append(self, data):
+        self.addChunk(data)
+
+    def fill(self, upto):
+        pass
+
+    def atEnd(self, seq):
+        return seq >= self.end
@@ -0,0 +1,140 @@
+from rdt_layer import RDTLayer, DATA_LENGTH
+from fastchannel import FastUnreliableChannel
+from congestion import WestwoodCongestionControl
+from sink import MmapSink
+from concurrent.futures import ProcessPoolExecutor
+import os
+import random
+import time
+
+
+# #################################################################################################################### #
+# Striped Transfer                                                                                                     #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Sends one file as N independent RDT sub-streams, each a client and a server layer joined by their own channel pair   #
+# in a worker process, so a bulk transfer uses N cores instead of one.                                                 #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# Nothing but the stripe's bounds and its results crosses the process boundary. A worker reads its range of the input  #
+# file itself, and its server writes the delivered data straight into its range of the output file through an          #
+# MmapSink. Once every worker is done, the output holds the stripes in order.                                          #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+READ_SIZE = 64 * 1024       # bytes a worker reads from the input file at a time
+
+
+# #################################################################################################################### #
+# StripeOptions                                                                                                        #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# How each stripe's layers and channels are set up. Passed to the workers, so it only holds plain values. The channels #
+# are reliable unless emulate asks for the channel ratios' drops, delays, errors and reordering, like rdt_stripe.py    #
+# #################################################################################################################### #
+class StripeOptions(object):
+    def __init__(self, segmentSize=None, receiveBuffer=None, emulate=False, seed=None):
+        self.segmentSize = segmentSize
+        self.receiveBuffer = receiveBuffer
+        self.emulate = emulate
+        self.seed = seed
+
+
+# #################################################################################################################### #
+# splitStripes()                                                                                                       #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# (offset, length) of each of `stripes` contiguous ranges covering size bytes, the first ones one byte longer when     #
+# size doesn't divide evenly                                                                                           #
+# #################################################################################################################### #
+def splitStripes(size, stripes):
+    stripes = max(1, min(stripes, size)) if size else 1
+    base, extra = divmod(size, stripes)
+    ranges = []
+    offset = 0
+    for i in range(stripes):
+        length = base + (1 if i < extra else 0)
+        ranges.append((offset, length))
+        offset += length
+    return ranges
+
+
+def readRange(path, offset, length):
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while length > 0:
+            chunk = f.read(min(READ_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+# #################################################################################################################### #
+# runStripe()                                                                                                          #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Worker. Transfers input bytes [offset, offset + length) over a fresh channel pair, lock-step like rdt_main.py, into  #
+# the same range of the output file. Returns the stripe's counters                                                     #
+# #################################################################################################################### #
+def runStripe(inputPath, outputPath, offset, length, options, index=0):
+    rng = random.Random(None if options.seed is None else options.seed * 1000003 + index)
+    emulate = options.emulate
+    clientToServerChannel = FastUnreliableChannel(emulate, emulate, emulate, emulate, seed=rng.randrange(2 ** 32))
+    serverToClientChannel = FastUnreliableChannel(emulate, emulate, emulate, emulate, seed=rng.randrange(2 ** 32))
+
+    client = RDTLayer()
+    server = RDTLayer()
+    for layer in (client, server):
+        layer.setSelectiveAck(True)
+        if options.segmentSize is not None:
+            layer.setSegmentSize(options.segmentSize)
+        if options.receiveBuffer is not None:
+            layer.setReceiveBuffer(options.receiveBuffer)
+    client.setSendChannel(clientToServerChannel)
+    client.setReceiveChannel(serverToClientChannel)
+    server.setSendChannel(serverToClientChannel)
+    server.setReceiveChannel(clientToServerChannel)
+    client.setCongestionControl(WestwoodCongestionControl(DATA_LENGTH))
+    client.setDataSource(readRange(inputPath, offset, length))
+    sink = MmapSink(outputPath, offset)
+    server.setDataSink(sink)
+
+    start = time.perf_counter()
+    loopIter = 0
+    while server.bytesDelivered() < length or not client.isSendComplete():
+        loopIter += 1
+        client.processData()
+        clientToServerChannel.processData()
+        server.processData()
+        serverToClientChannel.processData()
+    elapsed = time.perf_counter() - start
+    sink.close()
+
+    return {'offset': offset, 'bytes': server.bytesDelivered(), 'iterations': loopIter, 'seconds': elapsed,
+            'dataPackets': clientToServerChannel.countTotalDataPackets,
+            'ackPackets': serverToClientChannel.countAckPackets,
+            'timeouts': client.countSegmentTimeouts, 'fastRetransmits': client.countFastRetransmits}
+
+
+# #################################################################################################################### #
+# stripedTransfer()                                                                                                    #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Coordinator. Sizes the output file, runs one stripe per range on a pool of `workers` processes (os.cpu_count() by    #
+# default) and returns the stripes' results in file order                                                              #
+# #################################################################################################################### #
+def stripedTransfer(inputPath, outputPath, stripes, workers=None, options=None):
+    if options is None:
+        options = StripeOptions()
+    size = os.path.getsize(inputPath)
+    with open(outputPath, 'wb') as out:
+        out.truncate(size)
+    if size == 0:
+        return []
+
+    ranges = splitStripes(size, stripes)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(runStripe, inputPath, outputPath, offset, length, options, i)
+                   for i, (offset, length) in enumerate(ranges)]
+        return [future.result() for future in futures]
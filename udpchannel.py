@@ -0,0 +1,212 @@
+import heapq
+import errno
+import random
+import select
+import socket
+import struct
+
+from packedsegment import decodeBatch
+
+
+# #################################################################################################################### #
+# UdpChannel                                                                                                           #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# The UnreliableChannel interface (send/receive/processData, receiveQueue and the stats counters) over a non-blocking  #
+# UDP socket, so the client and the server can run in separate processes. One UdpChannel is both the send and the      #
+# receive channel of its endpoint.                                                                                     #
+#                                                                                                                      #
+# processData() flushes everything sent since the last call, packed into as few datagrams as fit MAX_DATAGRAM_SIZE,    #
+# then drains every datagram already waiting on the socket into receiveQueue. A side started without a remote address  #
+# answers whoever sent the last datagram it received.                                                                  #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# The drop/delay/corrupt/reorder flags emulate a lossy link on the sending side, with UnreliableChannel's ratios and a #
+# private seeded generator. With every flag off the only loss is the network's. Delays count processData() calls.      #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+class UdpChannel(object):
+    RATIO_DROPPED_PACKETS = 0.1
+    RATIO_DELAYED_PACKETS = 0.1
+    RATIO_DATA_ERROR_PACKETS = 0.1
+    RATIO_OUT_OF_ORDER_PACKETS = 0.1
+    ITERATIONS_TO_DELAY_PACKETS = 5
+    MAX_DATAGRAM_SIZE = 1472        # Ethernet MTU less the IP and UDP headers
+    RECEIVE_BUFFER_SIZE = 65535     # Largest UDP datagram
+    MAX_UDP_PAYLOAD = 65507         # Largest datagram payload over IPv4
+
+    def __init__(self, localAddress, remoteAddress=None, canDeliverOutOfOrder_=False, canDropPackets_=False,
+                 canDelayPackets_=False, canHaveChecksumErrors_=False, seed=None):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.socket.bind(localAddress)
+        self.remoteAddress = remoteAddress
+        self.learnAddress = remoteAddress is None
+        self.buffer = bytearray(UdpChannel.RECEIVE_BUFFER_SIZE)
+        self.sendQueue = []
+        self.receiveQueue = []
+        self.delayedPackets = []        # Heap of (release iteration, arrival order, segment)
+        self.order = 0
+        self.canDeliverOutOfOrder = canDeliverOutOfOrder_
+        self.canDropPackets = canDropPackets_
+        self.canDelayPackets = canDelayPackets_
+        self.canHaveChecksumErrors = canHaveChecksumErrors_
+        self.rng = random.Random(seed)
+        # stats
+        self.countTotalDataPackets = 0
+        self.countSentPackets = 0
+        self.countChecksumErrorPackets = 0
+        self.countDroppedPackets = 0
+        self.countDelayedPackets = 0
+        self.countOutOfOrderPackets = 0
+        self.countAckPackets = 0
+        self.countDatagramsSent = 0
+        self.countDatagramsReceived = 0
+        self.countBadDatagrams = 0
+        self.currentIteration = 0
+
+    def getAddress(self):
+        return self.socket.getsockname()
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    # Largest encoded segment that goes out at all, alone in a datagram. RDTLayer offers segment sizes that fit it
+    def getMaxSegmentSize(self):
+        return UdpChannel.MAX_UDP_PAYLOAD
+
+    def close(self):
+        self.socket.close()
+
+    def send(self,seg):
+        self.sendQueue.append(seg)
+
+    def receive(self):
+        new_list = self.receiveQueue
+        self.receiveQueue = []
+        return new_list
+
+    # Blocks until a datagram is waiting or timeout (seconds) passes, so a driver loop does not spin
+    def wait(self, timeout):
+        readable, writable, errors = select.select([self.socket], [], [], timeout)
+        return bool(readable)
+
+    def processData(self):
+        self.currentIteration += 1
+        self.flush(self.emulate())
+        self.drain()
+
+    # ################################################################################################################ #
+    # emulate()                                                                                                        #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Applies the emulated loss to the segments sent since the last call. Returns the segments to put on the wire now  #
+    # ################################################################################################################ #
+    def emulate(self):
+        outgoing = []
+        heap = self.delayedPackets
+        while heap and heap[0][0] <= self.currentIteration:
+            outgoing.append(heapq.heappop(heap)[2])
+
+        batch = self.sendQueue
+        self.sendQueue = []
+        if self.canDeliverOutOfOrder and self.rng.random() <= self.RATIO_OUT_OF_ORDER_PACKETS:
+            self.countOutOfOrderPackets += 1
+            batch.reverse()
+
+        r = self.rng.random
+        for seg in batch:
+            if self.canDelayPackets and r() <= self.RATIO_DELAYED_PACKETS:
+                self.countDelayedPackets += 1
+                seg.setStartDelayIteration(self.currentIteration)
+                self.order += 1
+                heapq.heappush(heap, (self.currentIteration + self.ITERATIONS_TO_DELAY_PACKETS, self.order, seg))
+                continue
+
+            if seg.seqnum != -1:
+                self.countTotalDataPackets += 1
+                # only data packets can have checksum errors...
+                if self.canHaveChecksumErrors and r() <= self.RATIO_DATA_ERROR_PACKETS:
+                    seg.createChecksumError(self.rng)
+                    self.countChecksumErrorPackets += 1
+            else:
+                # count ack packets...
+                self.countAckPackets += 1
+
+            if self.canDropPackets and r() <= self.RATIO_DROPPED_PACKETS:
+                self.countDroppedPackets += 1
+            else:
+                outgoing.append(seg)
+        return outgoing
+
+    # ################################################################################################################ #
+    # flush()                                                                                                          #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Encodes the segments and packs them back to back into datagrams of at most MAX_DATAGRAM_SIZE, one sendto() per   #
+    # datagram                                                                                                         #
+    # ################################################################################################################ #
+    def flush(self, segments):
+        if not segments:
+            return
+        if self.remoteAddress is None:
+            # Nobody to answer yet
+            self.countDroppedPackets += len(segments)
+            return
+
+        datagram = []
+        size = 0
+        for seg in segments:
+            encoded = seg.encode()
+            if datagram and size + len(encoded) > self.MAX_DATAGRAM_SIZE:
+                self.sendDatagram(datagram)
+                datagram = []
+                size = 0
+            datagram.append(encoded)
+            size += len(encoded)
+        self.sendDatagram(datagram)
+
+    def sendDatagram(self, encoded):
+        try:
+            self.socket.sendto(b''.join(encoded), self.remoteAddress)
+        except (BlockingIOError, ConnectionRefusedError):
+            # Socket buffer full or the peer is not listening yet, the datagram is lost like any other
+            self.countDroppedPackets += len(encoded)
+            return
+        except OSError as e:
+            if e.errno != errno.EMSGSIZE:
+                raise
+            # A segment too big for any datagram, which RDTLayer's offer keeps it from sending. Counted lost, not fatal
+            self.countDroppedPackets += len(encoded)
+            return
+        self.countDatagramsSent += 1
+        self.countSentPackets += len(encoded)
+
+    # ################################################################################################################ #
+    # drain()                                                                                                          #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Reads every datagram waiting on the socket, without blocking, and decodes its segments into receiveQueue         #
+    # ################################################################################################################ #
+    def drain(self):
+        view = memoryview(self.buffer)
+        while True:
+            try:
+                length, address = self.socket.recvfrom_into(self.buffer)
+            except (BlockingIOError, InterruptedError):
+                break
+            except ConnectionRefusedError:
+                # ICMP port unreachable for an earlier datagram
+                continue
+            self.countDatagramsReceived += 1
+            try:
+                segments = decodeBatch(view[:length])
+            except (ValueError, struct.error):
+                # Not a whole batch of segments, the checksums can't even be read
+                self.countBadDatagrams += 1
+                continue
+            self.receiveQueue.extend(segments)
+            if self.learnAddress:
+                self.remoteAddress = address